@@ -0,0 +1,194 @@
+# batch.py
+# Lodinu Kalugalage
+#
+# Description: This file contains the batch runner, which renders many choreographies, or
+# variants of one, on a pool of processes and reports how long every job took.
+#
+# A batch file lists jobs, and/or sweeps that make a job for every combination of values:
+# {
+#     "frames": 50,
+#     "jobs": [{"name": "one", "choreo": "../choreo/one.json", "quality": "draft"}],
+#     "sweep": {
+#         "choreo": "../choreo/two.json",
+#         "parameters": {"objects.light_one.intensity": [3, 11], "width": [500, 800]}
+#     }
+# }
+# Choreography paths are relative to the batch file, and parameters are keys of the
+# choreography joined with dots. A job can also give its own "overrides", "frames",
+# "backend", "quality" and "rates" ([tick, smoke, fps]).
+
+# Dependencies
+import concurrent.futures  # Included with python
+import itertools  # Included with python
+import json  # Included with python
+import os  # Included with python
+import time  # Included with python
+
+import director
+import render
+import scheduler as scheduling
+import util
+
+
+# Sets a value inside a choreography, `path` is the keys to it joined with dots,
+# e.g. "objects.light_one.intensity"
+def applyOverride(choreoJson: dict, path: str, value):
+    keys = path.split(".")
+    target = choreoJson
+    for key in keys[:-1]:
+        if key not in target:
+            raise ValueError(f"Can't override {path}, there's no {key}")
+        target = target[key]
+    target[keys[-1]] = value
+
+
+# Makes a job from its definition, the choreography is loaded and overridden here so
+# workers are only sent the finished json
+def makeJob(jobDef: dict, name: str, batchDir: str, defaults: dict):
+    choreoFile = os.path.join(batchDir, jobDef["choreo"])
+    with open(choreoFile, "r") as f:
+        choreoJson = json.load(f)
+    overrides = jobDef.get("overrides", {})
+    for path, value in overrides.items():
+        applyOverride(choreoJson, path, value)
+    return {
+        "name": name,
+        "choreo": choreoFile,
+        "overrides": overrides,
+        "json": json.dumps(choreoJson),
+        "frames": jobDef.get("frames", defaults["frames"]),
+        "backend": jobDef.get("backend", defaults["backend"]),
+        "quality": jobDef.get("quality", defaults["quality"]),
+        "rates": tuple(jobDef.get("rates", defaults["rates"])),
+    }
+
+
+# Expands a batch definition into jobs, sweeps are numbered after their choreography
+# `defaults` has the "frames", "backend", "quality" and "rates" of jobs that don't set them
+def makeJobs(batchDef: dict, batchDir: str, defaults: dict):
+    defaults = dict(defaults, frames=batchDef.get("frames", defaults["frames"]))
+    jobs = []
+    for i, jobDef in enumerate(batchDef.get("jobs", [])):
+        name = jobDef.get("name", f"job-{i}")
+        jobs.append(makeJob(jobDef, name, batchDir, defaults))
+
+    sweeps = batchDef.get("sweep", [])
+    for sweep in [sweeps] if isinstance(sweeps, dict) else sweeps:
+        stem = sweep.get("name", os.path.splitext(os.path.basename(sweep["choreo"]))[0])
+        paths = list(sweep["parameters"])
+        combinations = itertools.product(*sweep["parameters"].values())
+        for i, values in enumerate(combinations):
+            overrides = dict(sweep.get("overrides", {}), **dict(zip(paths, values)))
+            jobDef = dict(sweep, overrides=overrides)
+            jobs.append(makeJob(jobDef, f"{stem}-{i}", batchDir, defaults))
+
+    names = [job["name"] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("Every job in a batch needs its own name")
+    return jobs
+
+
+# Loads the images and imports the modules the jobs need, done before the pool starts so
+# forked workers share them, and again in each worker for platforms that don't fork
+# Images are memory-mapped from the asset cache, so workers share their pages either way
+def preload(jobs: list):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    if any(job["backend"] == "matplotlib" for job in jobs):
+        import matplotlib.pyplot
+    for job in jobs:
+        choreoJson = json.loads(job["json"])
+        choreo = director.Choreography(job["json"], job["backend"], job["quality"])
+        backdrop = choreoJson.get("backdrop")
+        if isinstance(backdrop, str) and backdrop.startswith("file://"):
+            util.loadImage(backdrop[7:])
+        for obj in choreoJson["objects"].values():
+            if obj["type"] not in director.Choreography.objectMapping:
+                continue
+            subsystem = director.Choreography.getSubsystem(obj["type"])
+            if obj["type"] == "prop":
+                util.loadImage(obj["img"])
+            if obj["type"] == "smokemachinevolume":
+                subsystem.getEngine(choreo.getSmokeSettings(obj)[1])
+
+
+# Renders one job into `outputDir`, a failed job is reported rather than stopping the batch
+def runJob(job: dict, outputDir: str):
+    start = time.perf_counter()
+    result = {
+        "name": job["name"],
+        "frames": job["frames"],
+        "overrides": job["overrides"],
+    }
+    choreo = None
+    try:
+        os.makedirs(outputDir, exist_ok=True)
+        with open(os.path.join(outputDir, "choreo.json"), "w") as f:
+            f.write(job["json"])
+        choreo = director.Choreography(job["json"], job["backend"], job["quality"])
+        choreo.parse()
+        parsed = time.perf_counter()
+        render.renderFrames(
+            scheduling.Scheduler(choreo, *job["rates"]),
+            job["frames"],
+            headless=True,
+            progress=False,
+            checkpointEvery=0,
+            outputDir=outputDir,
+        )
+        result["status"] = "ok"
+        result["parse"] = parsed - start
+        result["render"] = time.perf_counter() - parsed
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = repr(e)
+    finally:
+        # Workers run many jobs, so figures have to be closed to not pile up
+        if choreo is not None and hasattr(choreo, "stage"):
+            choreo.stage.close()
+    result["total"] = time.perf_counter() - start
+    return result
+
+
+# Prints a line for every job, in the order they were given
+def printSummary(results: list, elapsed: float):
+    print(f"{'job':<24}{'status':<8}{'frames':>7}{'parse':>9}{'render':>9}{'fps':>8}")
+    for result in results:
+        line = f"{result['name']:<24}{result['status']:<8}{result['frames']:>7}"
+        if result["status"] == "ok":
+            fps = result["frames"] / result["render"] if result["render"] else 0
+            line += f"{result['parse']:>8.2f}s{result['render']:>8.2f}s{fps:>8.2f}"
+        else:
+            line += "  " + result["error"]
+        print(line)
+    print(f"{len(results)} jobs in {elapsed:.2f}s")
+
+
+# Runs every job in a batch file on `workers` processes, each job renders into its own
+# folder in `outputDir`, and a summary of them all is saved as summary.json there
+def runBatch(batchFile: str, defaults: dict, workers: int, outputDir: str):
+    start = time.perf_counter()
+    with open(batchFile, "r") as f:
+        jobs = makeJobs(json.load(f), os.path.dirname(batchFile), defaults)
+    preload(jobs)
+
+    results = [None] * len(jobs)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=preload, initargs=(jobs,)
+    ) as pool:
+        futures = {
+            pool.submit(runJob, job, os.path.join(outputDir, job["name"])): i
+            for i, job in enumerate(jobs)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            print(f"Finished {result['name']} ({result['status']})")
+
+    elapsed = time.perf_counter() - start
+    os.makedirs(outputDir, exist_ok=True)
+    with open(os.path.join(outputDir, "summary.json"), "w") as f:
+        json.dump({"elapsed": elapsed, "jobs": results}, f, indent=4)
+    printSummary(results, elapsed)
+    return results
@@ -0,0 +1,282 @@
+# benchmark.py
+# Lodinu Kalugalage
+#
+# Description: This file contains the benchmark suite, which times parsing, smoke steps, every
+# layer of drawing, grabbing and writing frames on their own. It runs on the bundled choreographies and on
+# generated scenes that scale up one part of the scene at a time, and saves the results as
+# JSON so runs can be compared.
+#
+# Run from `src/`:
+#     python benchmark.py [results.json] [options]
+#
+#     --frames=N          frames timed in every scene (default 5)
+#     --backend=numpy     time the NumPy render backend instead of matplotlib
+#     --quality=NAME      smoke preset for every volume: draft, preview or final
+#     --engine=NAME       smoke engine for every volume, generated scenes default to `SMOKE_ENGINE`
+#     --suite=NAME        only run the "bundled" or the "generated" scenes
+
+# Dependencies
+import glob  # Included with python
+import json  # Included with python
+import os  # Included with python
+import platform  # Included with python
+import statistics  # Included with python
+import sys  # Included with python
+import tempfile  # Included with python
+import time  # Included with python
+
+import numpy as np
+
+import constants as c
+import director
+import util
+import writer
+
+PARSE_REPEATS = 3  # Times every scene is parsed, parsing is quick so it's repeated
+
+# Scene every generated scene starts from, `size` scales the 500 by 400 stage
+baseScene = {"lights": 4, "depth": 1, "props": 2, "machines": 2, "size": 1}
+
+# Values each part of the base scene is scaled through, one part at a time
+sceneSweeps = {
+    "lights": [16, 64],
+    "depth": [4, 16],
+    "props": [8, 32],
+    "machines": [0, 8],
+    "size": [0.5, 2],
+}
+
+# Colours the generated lights cycle through
+sceneColours = ["red", "blue", "green", ["purple", "blue"]]
+
+
+# Makes a choreography with `lights` lights inside `depth` nested light groups, `props`
+# props and `machines` smoke machines in one volume, on a stage `size` times 500 by 400
+# The steps move and recolour everything, like the bundled choreographies do
+def makeScene(
+    lights: int, depth: int, props: int, machines: int, size: float, engine: str
+):
+    width, height = int(500 * size), int(400 * size)
+    objects = {}
+    forwards, backwards = [], []
+
+    for i in range(lights):
+        key = f"light_{i}"
+        objects[key] = {
+            "type": "light",
+            "colour": sceneColours[i % len(sceneColours)],
+            "position": (i + 0.5) * width / lights - width / 2,
+            "direction": 40 + 100 * i / max(lights - 1, 1),
+            "intensity": 5,
+            "spread": 25,
+        }
+        forwards.append(["light", key, "position", "add", 15])
+        backwards.append(["light", key, "position", "sub", 15])
+
+    # Each group holds the next one, and the innermost holds the lights
+    for i in range(depth):
+        objects[f"group_{i}"] = {
+            "type": "lightgroup",
+            "lights": [f"light_{j}" for j in range(lights)] if i == depth - 1 else [],
+            "lightgroups": [f"group_{i + 1}"] if i < depth - 1 else [],
+        }
+    if depth > 0:
+        forwards.append(["lightgroup", "group_0", "colour", "green"])
+        backwards.append(["lightgroup", "group_0", "colour", "blue"])
+
+    for i in range(props):
+        key = f"prop_{i}"
+        objects[key] = {
+            "type": "prop",
+            "img": (
+                "../assets/props/guitar.png" if i % 2 else "../assets/props/drums.png"
+            ),
+            "scale": 2,
+            "position": [i * (width - 32) / max(props - 1, 1), 5],
+        }
+        forwards.append(["prop", key, "position", "add", [0, 40]])
+        backwards.append(["prop", key, "position", "sub", [0, 40]])
+
+    for i in range(machines):
+        key = f"sm_{i}"
+        objects[key] = {
+            "type": "smokemachine",
+            "position": [(i + 0.5) * width / machines, 10],
+            "intensity": 10,
+        }
+        forwards.append(["smokemachine", key, "intensity", "add", 1])
+        backwards.append(["smokemachine", key, "intensity", "sub", 1])
+    if machines > 0:
+        objects["smv"] = {
+            "type": "smokemachinevolume",
+            "smokemachines": [f"sm_{i}" for i in range(machines)],
+            "colour": [1, 0.8901, 0.4902],
+            "engine": engine,
+        }
+
+    return {
+        "backdrop": "file://../assets/backdrops/blue_gradient.png",
+        "width": width,
+        "height": height,
+        "objects": objects,
+        "steps": [forwards, [["buffer", 1]], backwards, [["buffer", 3]]],
+    }
+
+
+# Every scene to benchmark as (name, parameters, choreography), parameters are None
+# for the bundled choreographies
+def makeScenes(suites: list, engine: str | None):
+    scenes = []
+    if "bundled" in suites:
+        for filename in sorted(glob.glob(util.getPath("../assets/choreo/*.json"))):
+            with open(filename, "r") as f:
+                choreoJson = json.load(f)
+            if engine is not None:
+                for obj in choreoJson["objects"].values():
+                    if obj["type"] == "smokemachinevolume":
+                        obj["engine"] = engine
+            name = os.path.splitext(os.path.basename(filename))[0]
+            scenes.append((name, None, choreoJson))
+
+    if "generated" in suites:
+        engine = engine or c.SMOKE_ENGINE
+        scenes.append(("base", baseScene, makeScene(**baseScene, engine=engine)))
+        for part, values in sceneSweeps.items():
+            for value in values:
+                parameters = dict(baseScene, **{part: value})
+                scenes.append(
+                    (
+                        f"{part}-{value}",
+                        parameters,
+                        makeScene(**parameters, engine=engine),
+                    )
+                )
+    return scenes
+
+
+# Runs `function` and adds how long it took in seconds to `times`
+def timed(times: list, function, *args):
+    start = time.perf_counter()
+    function(*args)
+    times.append(time.perf_counter() - start)
+
+
+# Summary of a list of times in seconds, the first is kept apart from the rest as it
+# includes making artists and filling caches
+def summarise(times: list):
+    if not times:
+        return None
+    return {
+        "count": len(times),
+        "first": times[0],
+        "mean": statistics.fmean(times),
+        "median": statistics.median(times),
+        "min": min(times),
+        "max": max(times),
+        "total": sum(times),
+    }
+
+
+# Times one scene, giving a summary of every part that was timed
+def benchScene(choreoJson: dict, backend: str, quality: str | None, frames: int):
+    jsonBlock = json.dumps(choreoJson)
+    times = {"parse": []}
+    for _ in range(PARSE_REPEATS):
+        choreo = director.Choreography(jsonBlock, backend, quality)
+        timed(times["parse"], choreo.parse)
+        choreo.stage.close()
+
+    choreo = director.Choreography(jsonBlock, backend, quality)
+    choreo.parse()
+    # With matplotlib the layers only update artists, everything is rasterized by
+    # the grab, while the numpy backend does all of its work in the layers
+    choreo.stage.prepareGrab()
+    layers = {"draw." + name: drawLayer for name, drawLayer in choreo.drawLayers()}
+    for name in ["smoke", "tick", *layers, "grab", "write", "clean"]:
+        times[name] = []
+    # Frames are written by a `FrameWriter` like a headless render's, each is waited
+    # for so the time covers all of it, rendering usually carries on while it's written
+    frameWriter = writer.FrameWriter()
+    with tempfile.TemporaryDirectory() as snapshotDir:
+        for i in range(frames):
+            timed(times["smoke"], choreo.stepSmoke)
+            timed(times["tick"], choreo.tick)
+            for name, draw in layers.items():
+                timed(times[name], draw)
+            start = time.perf_counter()
+            frame = choreo.stage.grab()
+            times["grab"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            frameWriter.write(frame, os.path.join(snapshotDir, f"{i}.png"), i)
+            frameWriter.flush()
+            times["write"].append(time.perf_counter() - start)
+            timed(times["clean"], choreo.clean)
+        frameWriter.close()
+    choreo.stage.close()
+
+    return {
+        "objects": {name: len(objects) for name, objects in choreo.objectBins.items()},
+        "stage": [choreo.stageInfo.width, choreo.stageInfo.height],
+        "times": {name: summarise(values) for name, values in times.items()},
+    }
+
+
+# Prints the mean time of every part of every scene in milliseconds
+def printResults(results: list):
+    parts = list(results[0]["times"])
+    print(f"{'scene':<16}" + "".join(f"{part:>12}" for part in parts))
+    for result in results:
+        line = f"{result['name']:<16}"
+        for part in parts:
+            summary = result["times"][part]
+            line += f"{summary['mean'] * 1000:>12.2f}" if summary else f"{'-':>12}"
+        print(line)
+    print("Mean times in milliseconds")
+
+
+def main():
+    args, flags = util.parseArgs(sys.argv[1:])
+    outputFile = args[0] if args else "benchmark.json"
+    frames = int(flags.get("frames", 5))
+    backend = flags.get("backend", "matplotlib")
+    quality = flags.get("quality")
+    engine = flags.get("engine")
+    suites = [flags["suite"]] if "suite" in flags else ["bundled", "generated"]
+
+    # Benchmarks never show a window
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+    results = []
+    for name, parameters, choreoJson in makeScenes(suites, engine):
+        print(f"Benchmarking {name}")
+        result = benchScene(choreoJson, backend, quality, frames)
+        results.append(dict({"name": name, "parameters": parameters}, **result))
+
+    with open(outputFile, "w") as f:
+        json.dump(
+            {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "matplotlib": matplotlib.__version__,
+                "settings": {
+                    "frames": frames,
+                    "backend": backend,
+                    "quality": quality,
+                    "engine": engine,
+                    "parseRepeats": PARSE_REPEATS,
+                },
+                "scenes": results,
+            },
+            f,
+            indent=4,
+        )
+    printResults(results)
+    print(f"Saved results to {outputFile}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# choreofile.py
+# Lodinu Kalugalage
+#
+# Description: This file contains the compiled choreography format, a compact binary form of
+# a choreography's steps that is read a step at a time through a memory map, so a show with
+# hundreds of thousands of steps never has to be loaded or held as python lists.
+#
+# A compiled file is:
+#     MAGIC, the length of the header as a little endian uint64, then the header as JSON,
+#     then (each starting on a multiple of 8 bytes)
+#     starts    uint64 for every step, the index of its first entry, and one past the end
+#     entries   (opcode, target, operand) for every entry of every step
+#     operands  float64 values the entries point at
+# The header holds the rest of the choreography (stage, backdrop and objects) along with
+# the interned object names, the values that aren't numbers (like colours) and the opcodes,
+# each opcode being one kind of entry, e.g. ["prop", "position", "add", "pair"]
+#
+# Compile a choreography from `src/`:
+#     python choreofile.py choreo.json [compiled.choreo]
+
+# Dependencies
+import json  # Included with python
+import os  # Included with python
+import sys  # Included with python
+
+import numpy as np
+
+import util
+
+MAGIC = b"SPTCHOR\0"  # First bytes of every compiled choreography
+VERSION = 1  # Version of the format, files of other versions aren't loaded
+ALIGNMENT = 8  # Arrays in the file start on a multiple of this many bytes
+
+# One entry of a step: which opcode it is, the object it changes and its first operand
+entryType = np.dtype([("opcode", "<u2"), ("target", "<u4"), ("operand", "<u8")])
+
+
+# Whether a file is a compiled choreography rather than JSON
+def isCompiled(filename: str):
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+# Whether a value can be packed as an operand
+def isNumber(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# Splits a step entry into its opcode, object key and value
+# Entries are [type, value], [type, key, action, value] or [type, key, action, operator,
+# value], numbers and [x, y] pairs are packed as operands, anything else is interned
+def splitEntry(step: list):
+    if len(step) == 2:
+        opcode, key, value = (step[0], None, None), None, step[1]
+    elif len(step) == 4:
+        opcode, key, value = (step[0], step[2], None), step[1], step[3]
+    elif len(step) == 5:
+        opcode, key, value = (step[0], step[2], step[3]), step[1], step[4]
+    else:
+        raise ValueError(f"{step!r} is malformed")
+
+    if isNumber(value):
+        kind = "number"
+    elif isinstance(value, list) and len(value) == 2 and all(map(isNumber, value)):
+        kind = "pair"
+    else:
+        kind = "value"
+    return opcode + (kind,), key, value
+
+
+# Compiles a choreography's steps into the binary format and saves it as `filename`
+# Steps that do nothing (on smoke machine volumes) are left out, everything else is
+# checked when the compiled file is parsed, the same as JSON
+def compileChoreography(choreoJson: dict, filename: str):
+    opcodes, names, values = {}, {}, {}
+    starts, entries, operands = [0], [], []
+    for i, thisStep in enumerate(choreoJson["steps"]):
+        for step in thisStep:
+            try:
+                if step[0] == "smokemachinevolume":
+                    continue
+                opcode, key, value = splitEntry(step)
+            except (IndexError, TypeError, ValueError):
+                raise ValueError(f"step {i}: {step!r} can't be compiled")
+            kind = opcode[-1]
+            target = 0 if key is None else names.setdefault(key, len(names))
+            entries.append(
+                (opcodes.setdefault(opcode, len(opcodes)), target, len(operands))
+            )
+            if kind == "number":
+                operands.append(value)
+            elif kind == "pair":
+                operands.extend(value)
+            else:
+                # Values are interned by their JSON, so equal colours are kept once
+                operands.append(values.setdefault(json.dumps(value), len(values)))
+        starts.append(len(entries))
+
+    header = {
+        "version": VERSION,
+        "choreography": {k: v for k, v in choreoJson.items() if k != "steps"},
+        "opcodes": list(opcodes),
+        "names": list(names),
+        "values": [json.loads(value) for value in values],
+        "steps": len(starts) - 1,
+        "entries": len(entries),
+        "operands": len(operands),
+    }
+    headerBytes = json.dumps(header).encode("utf-8")
+    arrays = [
+        np.array(starts, dtype="<u8"),
+        np.array(entries, dtype=entryType),
+        np.array(operands, dtype="<f8"),
+    ]
+    with open(filename + ".tmp", "wb") as f:
+        f.write(MAGIC)
+        f.write(len(headerBytes).to_bytes(8, "little"))
+        f.write(headerBytes)
+        for array in arrays:
+            f.write(b"\0" * (-f.tell() % ALIGNMENT))
+            f.write(array.tobytes())
+    os.replace(filename + ".tmp", filename)
+
+
+class StepStream:
+    starts: np.ndarray  # Index of the first entry of every step, memory-mapped
+    entries: np.ndarray  # Every entry of every step, memory-mapped
+    operands: np.ndarray  # Values the entries point at, memory-mapped
+    opcodes: list  # (type, action, operator, kind) of every opcode
+    names: list  # Keys of the objects the entries change
+    values: list  # Values that aren't numbers, like colours
+
+    # Constructor for a `StepStream`, maps the arrays of a compiled choreography
+    # `offset` is where the arrays start in the file
+    def __init__(self, filename: str, header: dict, offset: int):
+        self.opcodes = [tuple(opcode) for opcode in header["opcodes"]]
+        self.names = header["names"]
+        self.values = header["values"]
+        arrays = []
+        for dtype, count in [
+            (np.dtype("<u8"), header["steps"] + 1),
+            (entryType, header["entries"]),
+            (np.dtype("<f8"), header["operands"]),
+        ]:
+            offset += -offset % ALIGNMENT
+            # Empty arrays can't be mapped, and there's nothing to read from them
+            if count == 0:
+                arrays.append(np.zeros(0, dtype=dtype))
+            else:
+                mapped = np.memmap(
+                    filename, dtype=dtype, mode="r", offset=offset, shape=count
+                )
+                # Slices of a plain array view are much quicker to take than a memmap's,
+                # it's still backed by the map
+                arrays.append(mapped.view(np.ndarray))
+            offset += dtype.itemsize * count
+        self.starts, self.entries, self.operands = arrays
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    # Reads step `i` back as the lists it was compiled from
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("step index out of range")
+        first, last = self.starts[i], self.starts[i + 1]
+        if first == last:
+            return []
+        entries = self.entries[first:last].tolist()
+        # A step's operands are all together, so they're read in one go
+        base = entries[0][2]
+        end = self.entries[last]["operand"] if last < len(self.entries) else None
+        operands = [
+            int(value) if value.is_integer() else value
+            for value in self.operands[base:end].tolist()
+        ]
+        thisStep = []
+        for opcode, target, operand in entries:
+            t, action, operator, kind = self.opcodes[opcode]
+            operand -= base
+            if kind == "number":
+                value = operands[operand]
+            elif kind == "pair":
+                value = operands[operand : operand + 2]
+            else:
+                value = self.values[operands[operand]]
+            if action is None:
+                thisStep.append([t, value])
+            elif operator is None:
+                thisStep.append([t, self.names[target], action, value])
+            else:
+                thisStep.append([t, self.names[target], action, operator, value])
+        return thisStep
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+# Loads a compiled choreography, giving back the choreography without its steps as JSON
+# and a `StepStream` of the steps
+def loadChoreography(filename: str):
+    with open(filename, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filename} isn't a compiled choreography")
+        length = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(length).decode("utf-8"))
+    if header.get("version") != VERSION:
+        raise ValueError(
+            f"{filename} is version {header.get('version')} of the compiled format, "
+            f"only version {VERSION} can be loaded"
+        )
+    steps = StepStream(filename, header, len(MAGIC) + 8 + length)
+    return json.dumps(header["choreography"]), steps
+
+
+def main():
+    args, _ = util.parseArgs(sys.argv[1:])
+    if not args:
+        print("Usage: python choreofile.py choreo.json [compiled.choreo]")
+        sys.exit(1)
+    outputFile = args[1] if len(args) > 1 else os.path.splitext(args[0])[0] + ".choreo"
+    with open(args[0], "r") as f:
+        choreoJson = json.load(f)
+    compileChoreography(choreoJson, outputFile)
+    print(f"Compiled {len(choreoJson['steps'])} steps into {outputFile}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@
 # a colour in the scene.
 
 # Dependencies
-import matplotlib.colors as colors
+import numpy as np
 
 
 class Colour:
@@ -43,6 +43,20 @@ def getOrMakeCMAP(a, b, name=None):
     if key in storedCmaps:
         return storedCmaps[key]
     else:
+        # matplotlib is slow to import, so it waits until a colour map is needed
+        import matplotlib.colors as colors
+
         newCmap = colors.LinearSegmentedColormap.from_list(key, [a, b])
         storedCmaps[key] = newCmap
         return newCmap
+
+
+# Colours sampled from top to bottom of a colour map, one per row of the stage
+storedGradients = {}
+
+
+def getOrMakeGradient(cmap, size: int):
+    key = (cmap.name, size)
+    if key not in storedGradients:
+        storedGradients[key] = cmap(np.linspace(0, 1, size)).astype(np.float32)
+    return storedGradients[key]
@@ -0,0 +1,196 @@
+# compositor.py
+# Lodinu Kalugalage
+#
+# Description: This file contains the FrameCompositor class, a render backend which
+# composites every frame straight into a NumPy buffer instead of going through matplotlib.
+
+# Dependencies
+import numpy as np
+import matplotlib.colors as colors
+from PIL import Image  # Included with matplotlib
+
+import constants as c
+import stage as stg
+
+
+class FrameCompositor:
+    descriptor: stg.StageDescriptor  # Stage descriptor
+    frame: np.ndarray  # RGBA frame, the topdown strip stacked over the audience view
+    top: np.ndarray  # View of the topdown strip inside `frame`
+    side: np.ndarray  # View of the audience view inside `frame`
+    background: np.ndarray  # Backdrop, copied into `frame` at the start of every frame
+    output: np.ndarray  # 8 bit copy of `frame`, used for snapshots
+    fig = None  # Figure used to show the frame in the interactive view
+    artist = None  # Image artist showing the frame
+
+    # Constructor for a `FrameCompositor`
+    def __init__(self, descriptor: stg.StageDescriptor):
+        self.descriptor = descriptor
+        width = int(descriptor.width)
+        height = int(descriptor.height)
+        topHeight = int(c.LIGHT_SOURCE_DIAMETER)
+
+        # Everything is allocated once, drawing only ever writes into these
+        self.frame = np.zeros((topHeight + height, width, 4), dtype=np.float32)
+        self.frame[..., 3] = 1
+        self.top = self.frame[:topHeight]
+        self.side = self.frame[topHeight:]
+        self.output = np.zeros(self.frame.shape, dtype=np.uint8)
+        self.scratch = np.zeros(self.frame.shape, dtype=np.float32)
+
+        # Stage coordinates of the centre of every pixel, y goes up from the bottom
+        self.xs = np.arange(width) + 0.5
+        self.topYs = topHeight - np.arange(topHeight) - 0.5
+        self.sideYs = height - np.arange(height) - 0.5
+
+        self.background = self.frame.copy()
+        self.drawBackdrop()
+
+    # Draws the backdrop into the background buffer, this only happens once
+    def drawBackdrop(self):
+        self.frame[...] = self.background
+        backdrop = self.descriptor.backdrop
+        if backdrop is not None:
+            if self.descriptor.isFile and self.descriptor.source is not None:
+                source = self.descriptor.source
+                self.blendImage(
+                    self.side,
+                    self.sideYs,
+                    source,
+                    [0, self.descriptor.width, 0, self.descriptor.height],
+                )
+                self.blendImage(
+                    self.top,
+                    self.topYs,
+                    source[0 : int(c.LIGHT_SOURCE_DIAMETER), 0 : source.shape[1]],
+                    [0, self.descriptor.width, 0, c.LIGHT_SOURCE_DIAMETER],
+                )
+            else:
+                self.frame[..., :3] = colors.to_rgb(backdrop)
+        self.background[...] = self.frame
+
+    # Starts a new frame from the backdrop
+    def draw(self):
+        np.copyto(self.frame, self.background)
+
+    # Blends `rgb` over `view` with a per pixel (or single) alpha
+    @staticmethod
+    def blend(view: np.ndarray, rgb, alpha):
+        alpha = np.asarray(alpha, dtype=np.float32)
+        if alpha.ndim == 2:
+            alpha = alpha[..., None]
+        view[..., :3] += (rgb - view[..., :3]) * alpha
+
+    # Draws an image into `view` so that it covers `extent` ([left, right, bottom, top]),
+    # sampling it with nearest neighbour like `imshow` does when scaling up
+    def blendImage(self, view: np.ndarray, ys: np.ndarray, img: np.ndarray, extent):
+        left, right, bottom, top = extent
+        cols = np.nonzero((self.xs >= left) & (self.xs < right))[0]
+        rows = np.nonzero((ys >= bottom) & (ys < top))[0]
+        if len(cols) == 0 or len(rows) == 0:
+            return
+
+        # Image row 0 is the top of the image
+        srcCols = ((self.xs[cols] - left) / (right - left) * img.shape[1]).astype(int)
+        srcRows = ((top - ys[rows]) / (top - bottom) * img.shape[0]).astype(int)
+        sample = img[
+            np.clip(srcRows, 0, img.shape[0] - 1)[:, None],
+            np.clip(srcCols, 0, img.shape[1] - 1)[None, :],
+        ]
+        if sample.dtype == np.uint8:
+            sample = sample / np.float32(255)
+        if sample.ndim == 2:
+            sample = np.repeat(sample[..., None], 3, axis=2)
+
+        target = view[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+        if sample.shape[2] == 4:
+            self.blend(target, sample[..., :3], sample[..., 3])
+        else:
+            target[..., :3] = sample[..., :3]
+
+    # Draws a grid of values over the whole audience view, origin at the bottom left,
+    # scaled up with bicubic interpolation and coloured by `cmap`
+    def blendDensity(self, vals: np.ndarray, cmap: colors.Colormap):
+        # Coloured like `imshow` would, normalised to the range of this frame
+        low, high = vals.min(), vals.max()
+        if high <= low:
+            normed = np.zeros(self.side.shape[:2])
+        else:
+            from skimage.transform import resize
+
+            upscaled = resize(vals, self.side.shape[:2], order=3, mode="edge")
+            normed = np.clip((upscaled - low) / (high - low), 0, 1)
+        rgba = cmap(normed[::-1])
+        self.blend(self.side, rgba[..., :3], rgba[..., 3])
+
+    # Fills a cone of light, `points` is the polygon from `Light.conePoints` and
+    # `gradient` holds a colour for every row of the audience view
+    def fillCone(self, points, gradient: np.ndarray, alpha: float):
+        upperLeft, upperRight, lowerRight, lowerLeft = points
+        # How far down the cone each row is, 0 at the top and 1 at the bottom
+        t = (upperLeft[1] - self.sideYs) / (upperLeft[1] - lowerLeft[1])
+        leftEdge = upperLeft[0] + (lowerLeft[0] - upperLeft[0]) * t
+        rightEdge = upperRight[0] + (lowerRight[0] - upperRight[0]) * t
+        inside = (self.xs >= leftEdge[:, None]) & (self.xs <= rightEdge[:, None])
+        self.blend(
+            self.side,
+            gradient[:, None, :3],
+            inside * (gradient[:, None, 3] * np.float32(alpha)),
+        )
+
+    # Fills a circle in the topdown strip
+    def fillCircle(self, centre, radius: float, colour, alpha: float):
+        distance = (self.xs[None, :] - centre[0]) ** 2 + (
+            self.topYs[:, None] - centre[1]
+        ) ** 2
+        inside = distance <= radius**2
+        self.blend(self.top, colors.to_rgb(colour), inside * np.float32(alpha))
+
+    # The frame is already rasterized, there's nothing left to do
+    def render(self):
+        pass
+
+    # Shows the frame in a figure for the interactive view
+    def show(self):
+        if self.artist is None:
+            # Only imported here, a headless render never needs pyplot
+            from matplotlib import pyplot as plt
+
+            self.fig = plt.figure(constrained_layout=True)
+            self.fig.suptitle("STAGE VIEW", fontsize="18")
+            ax = self.fig.add_subplot()
+            ax.set_axis_off()
+            self.artist = ax.imshow(self.frame, interpolation="nearest")
+        else:
+            self.artist.set_data(self.frame)
+
+    # Converts the frame to 8 bits, reusing the same buffers every time
+    def getOutput(self):
+        np.multiply(self.frame, 255, out=self.scratch)
+        self.scratch += 0.5
+        np.clip(self.scratch, 0, 255, out=self.scratch)
+        np.copyto(self.output, self.scratch, casting="unsafe")
+        return self.output
+
+    # The frame is always the same size, so there's nothing to set up
+    def prepareGrab(self):
+        pass
+
+    # Copy of the frame as an 8 bit RGBA array
+    def grab(self):
+        return self.getOutput().copy()
+
+    # Takes a snapshot of the stage, and stores in a directory
+    def snapshot(self, name: str):
+        Image.fromarray(self.getOutput()).save(name)
+
+    # Nothing is kept between frames, `draw` starts over from the backdrop
+    def clean(self):
+        pass
+
+    # Closes the figure of the interactive view, if it was ever shown
+    def close(self):
+        if self.fig is not None:
+            from matplotlib import pyplot as plt
+
+            plt.close(self.fig)
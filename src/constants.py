@@ -7,6 +7,47 @@ LIGHT_SOURCE_DIAMETER = 50.0  # Diameter of the light source in pixels
 LIGHT_SOURCE_RADIUS = LIGHT_SOURCE_DIAMETER / 2  # Radius of the light source in pixels
 
 SMOKE_SIM_RESOLUTION = 0.2  # Resolution of the smoke simulation
+# Named smoke qualities, a choreography or the command line can pick one by name
+# phiflow costs about the same per step at any resolution, so the quicker presets also run
+# on the NumPy engine, a preset without an "engine" keeps the volume's own
+SMOKE_QUALITY_PRESETS = {
+    "draft": {"resolution": 0.05, "engine": "numpy"},
+    "preview": {"resolution": 0.1, "engine": "numpy"},
+    "final": {"resolution": SMOKE_SIM_RESOLUTION},
+}
+SMOKE_DISPLAY_RESOLUTION = 0.2  # Coarser smoke is scaled up to this before it's drawn
 SMOKE_MACHINE_RADIUS = 20  # Radius of the smoke machine
+# Fluid solver for smoke volumes without an "engine" of their own, "phiflow" or "numpy"
+SMOKE_ENGINE = "phiflow"
+SMOKE_BACKEND = (
+    "numpy"  # phiflow backend for the smoke, "numpy", "jax" or "torch" (on CPU)
+)
+SMOKE_JIT = (
+    False  # Whether to jit compile the smoke step, needs the jax or torch backend
+)
+
+# Light groups with more lights than this draw all of their cones as one image
+LIGHT_BATCH_THRESHOLD = 8
+LIGHT_LAYER_RESOLUTION = 2  # Pixels per unit of stage in that image
+PROP_SPRITE_CACHE_SIZE = 64  # Number of scaled prop sprites to keep around
 
 CACHE_IMAGES = True  # Whether to cache images or not
+# Where decoded images are kept between runs, relative to `src/`, None to always decode them
+ASSET_CACHE_DIR = "../_assetcache"
+SNAPSHOT_DPI = 300  # Resolution of the canvas when headless frames are grabbed from it
+SNAPSHOT_WORKERS = 2  # Threads encoding and saving frames
+SNAPSHOT_QUEUE = 4  # Frames that can wait to be saved before rendering waits for them
+# Whether frames that look the same as an earlier one are saved as a link to it,
+# instead of being drawn and encoded again
+DEDUPE_FRAMES = True
+STEP_CACHE_SIZE = 4096  # Steps of a compiled choreography kept compiled at once
+CHECKPOINT_INTERVAL = (
+    0  # Frames between checkpoints of the whole simulation, 0 for none
+)
+CHECKPOINT_DIR = "_checkpoints"  # Where checkpoints are saved, next to `_simcache`
+FRAME_PAUSE = 0.1  # Seconds to pause between frames in the interactive view
+
+# Rates on the show clock, per second of show time
+TICK_RATE = 10  # Choreography ticks
+SMOKE_RATE = 10  # Smoke steps, each one `Volume.timeStep` of simulation
+FRAME_RATE = 10  # Output frames, lower than the others skips frames for quick previews
@@ -4,15 +4,139 @@
 # Description: This file contains the director class which is used to direct the scene.
 
 # Dependencies
+import functools  # Included with python
+import importlib  # Included with python
 import json  # Included with python
+import os  # Included with python
+from typing import TYPE_CHECKING  # Included with python
+
+import numpy as np
 
-import light
-import prop
-import smoke
 import stage as stg
 import colour
+import constants as c
+import choreofile
+import timeline as tl
+import tracing
 import util
 
+if TYPE_CHECKING:
+    import compositor
+
+
+class Operation(functools.partial):
+    objects: list  # Objects whose `attribute` the operation changes
+    attribute: str  # Attribute it changes
+    value = None  # Value the attribute is set to, or moved by
+    adds = False  # Whether `value` is added to the attribute instead of replacing it
+
+
+# Makes an operation a step compiles to, which is called with no arguments to run
+# `function(*args)` and says what it changes, so the timeline can follow the steps
+# without running them
+def makeOperation(
+    function, args: tuple, objects: list, attribute: str, value, adds=False
+):
+    operation = Operation(function, *args)
+    operation.objects = objects
+    operation.attribute = attribute
+    operation.value = value
+    operation.adds = adds
+    return operation
+
+
+# Adds `value` to a number `attribute` of `obj`
+def addToAttribute(obj, attribute: str, value):
+    setattr(obj, attribute, getattr(obj, attribute) + value)
+
+
+# Moves an [x, y] `attribute` of `obj` by `value`, keeping it as a tuple
+def moveAttribute(obj, attribute: str, value: tuple):
+    current = getattr(obj, attribute)
+    setattr(obj, attribute, (current[0] + value[0], current[1] + value[1]))
+
+
+# Makes an operation that changes a number `attribute` of `obj` with a step's
+# "set", "add" or "sub", or None if `operator` isn't one of those
+def makeNumberOperation(obj, attribute: str, operator: str, value):
+    if operator == "set":
+        return makeOperation(setattr, (obj, attribute, value), [obj], attribute, value)
+    if operator not in ("add", "sub"):
+        return None
+    if operator == "sub":
+        value = -value
+    return makeOperation(
+        addToAttribute, (obj, attribute, value), [obj], attribute, value, adds=True
+    )
+
+
+# Same as `makeNumberOperation`, for [x, y] positions which are stored as tuples
+def makePairOperation(obj, attribute: str, operator: str, value):
+    x, y = value
+    if operator == "set":
+        return makeOperation(
+            setattr, (obj, attribute, (x, y)), [obj], attribute, (x, y)
+        )
+    if operator not in ("add", "sub"):
+        return None
+    if operator == "sub":
+        x, y = -x, -y
+    return makeOperation(
+        moveAttribute, (obj, attribute, (x, y)), [obj], attribute, (x, y), adds=True
+    )
+
+
+# Attributes that steps can change on each type of object, and how to make their operations
+stepAttributes = {
+    "light": {
+        "position": makeNumberOperation,
+        "direction": makeNumberOperation,
+        "intensity": makeNumberOperation,
+    },
+    "prop": {"position": makePairOperation, "scale": makeNumberOperation},
+    "smokemachine": {"position": makePairOperation, "intensity": makeNumberOperation},
+}
+
+
+# Turns an object attribute into something JSON can hold, for checkpoints
+def encodeValue(value):
+    if isinstance(value, colour.Colour):
+        return {"colour": value.rawColour}
+    if isinstance(value, tuple):
+        return {"tuple": list(value)}
+    return value
+
+
+# Turns a value from `encodeValue` back into the attribute it was
+def decodeValue(value):
+    if isinstance(value, dict) and "colour" in value:
+        return colour.Colour(value["colour"])
+    if isinstance(value, dict) and "tuple" in value:
+        return tuple(value["tuple"])
+    return value
+
+
+class CompiledSteps:
+    steps: "choreofile.StepStream"  # Steps read from a compiled choreography
+    get = None  # Compiles step `i`, keeping the last `STEP_CACHE_SIZE` it compiled
+
+    # Constructor for `CompiledSteps`, `compileOperations` turns a step into its operations
+    def __init__(self, steps: "choreofile.StepStream", compileOperations):
+        self.steps = steps
+        self.get = functools.lru_cache(maxsize=c.STEP_CACHE_SIZE)(
+            lambda i: compileOperations(steps[i])
+        )
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __getitem__(self, i: int):
+        return self.get(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get(i)
+
 
 class Choreography:
     jsonBlock: str
@@ -24,30 +148,90 @@ class Choreography:
         "smokeMachineVolumes": {},
     }
     stageInfo: stg.StageDescriptor
-    stage: stg.StageDraw
+    stage: "stg.StageDraw | compositor.FrameCompositor"
+    backend: str  # "matplotlib" draws with artists, "numpy" composites into a buffer
 
+    # Object types, with the module and class they're made from and the bin they go in
+    # Modules are only imported once a choreography uses one of their types
     objectMapping = {
-        "light": [light.Light, "lights"],
-        "prop": [prop.Prop, "props"],
-        "smokemachine": [smoke.SmokeMachine, "smokeMachines"],
-        "lightgroup": [light.LightGroup, "lightGroups"],
-        "smokemachinevolume": [smoke.SmokeMachineVolume, "smokeMachineVolumes"],
+        "light": ["light", "Light", "lights"],
+        "prop": ["prop", "Prop", "props"],
+        "smokemachine": ["smoke", "SmokeMachine", "smokeMachines"],
+        "lightgroup": ["light", "LightGroup", "lightGroups"],
+        "smokemachinevolume": ["smoke", "SmokeMachineVolume", "smokeMachineVolumes"],
     }
 
     steps = {}
+    outerLightGroups: list  # Keys of the light groups that aren't inside another group
+    lightRig = None  # `light.LightRig` holding every light, when there are any
+    compiledSteps: "list | CompiledSteps"  # Every step as operations with no arguments
+    groupLights: dict  # Lights of every light group that steps change, by key
+    stepStream = None  # Steps of a compiled choreography, used instead of the json's
+    timeline: tl.Timeline  # State of the lights, props and smoke machines at any tick
 
     # Constructor for a `Choreography`
-    def __init__(self, jsonBlock: str):
+    # `quality` names one of `SMOKE_QUALITY_PRESETS` and overrides every smoke volume's own
+    # `stepStream` is given for compiled choreographies, whose json has no steps
+    def __init__(
+        self,
+        jsonBlock: str,
+        backend: str = "matplotlib",
+        quality: str | None = None,
+        stepStream: "choreofile.StepStream | None" = None,
+    ):
         self.jsonBlock = jsonBlock
+        self.quality = quality
+        self.stepStream = stepStream
+        # Made per instance, so choreographies parsed in the same process don't share objects
+        self.objectBins = {
+            "lights": {},
+            "props": {},
+            "smokeMachines": {},
+            "lightGroups": {},
+            "smokeMachineVolumes": {},
+        }
+        if backend not in ("matplotlib", "numpy"):
+            raise ValueError("Unknown render backend: " + backend)
+        self.backend = backend
+
+    # Loads a choreography from a file, either JSON or compiled (see choreofile.py)
+    @staticmethod
+    def loadFromFile(
+        filename: str, backend: str = "matplotlib", quality: str | None = None
+    ):
+        path = util.getPath(filename)
+        if choreofile.isCompiled(path):
+            jsonBlock, stepStream = choreofile.loadChoreography(path)
+            return Choreography(jsonBlock, backend, quality, stepStream)
+        with open(path, "r") as f:
+            return Choreography(f.read(), backend, quality)
+
+    # Resolution and engine of a smoke machine volume, from its "quality" preset or its
+    # own "resolution" and "engine"
+    def getSmokeSettings(self, smokeMachineVolumeDef: dict):
+        resolution = smokeMachineVolumeDef.get("resolution", c.SMOKE_SIM_RESOLUTION)
+        # "engine": "numpy" runs the volume on the built in NumPy solver
+        engine = smokeMachineVolumeDef.get("engine", c.SMOKE_ENGINE)
+        quality = self.quality or smokeMachineVolumeDef.get("quality")
+        if quality is None:
+            return resolution, engine
+        if quality not in c.SMOKE_QUALITY_PRESETS:
+            raise ValueError("Unknown smoke quality: " + quality)
+        preset = c.SMOKE_QUALITY_PRESETS[quality]
+        return preset["resolution"], preset.get("engine", engine)
 
-    # Loads a choreography from a file
+    # Imports the module that an object type is made in
     @staticmethod
-    def loadFromFile(filename: str):
-        with open(util.getPath(filename), "r") as f:
-            return Choreography(f.read())
+    def getSubsystem(objType: str):
+        return importlib.import_module(Choreography.objectMapping[objType][0])
 
-    # Parses the json
+    # Parses the json and makes the stage to draw on
     def parse(self):
+        self.parseObjects()
+        self.makeStage()
+
+    # Parses the json into objects, without making the stage
+    def parseObjects(self):
         loadedJson = json.loads(self.jsonBlock)
         self.stageInfo = stg.StageDescriptor(
             loadedJson["width"], loadedJson["height"], loadedJson["backdrop"]
@@ -62,13 +246,14 @@ class Choreography:
         for key in loadedJson["objects"]:
             obj = loadedJson["objects"][key]
             if obj["type"] in self.objectMapping:
-                intObjectBins[self.objectMapping[obj["type"]][1]][key] = obj
+                self.getSubsystem(obj["type"])
+                intObjectBins[self.objectMapping[obj["type"]][2]][key] = obj
             else:
                 print("Unknown object type: " + obj["type"])
 
         for light_key in intObjectBins["lights"]:
             lightDef = intObjectBins["lights"][light_key]
-            lightObj = light.Light(
+            lightObj = self.getSubsystem("light").Light(
                 colour.Colour(lightDef["colour"]),
                 lightDef["position"],
                 lightDef["direction"],
@@ -78,33 +263,49 @@ class Choreography:
 
         for prop_key in intObjectBins["props"]:
             propDef = intObjectBins["props"][prop_key]
-            propObj = prop.propFromFile(propDef["img"])
+            propObj = self.getSubsystem("prop").propFromFile(propDef["img"])
             propObj.scale = propDef["scale"]
             propObj.position = propDef["position"]
             self.objectBins["props"][prop_key] = propObj
 
         for smokeMachine_key in intObjectBins["smokeMachines"]:
             smokeMachineDef = intObjectBins["smokeMachines"][smokeMachine_key]
-            smokeMachineObj = smoke.SmokeMachine(
+            smokeMachineObj = self.getSubsystem("smokemachine").SmokeMachine(
                 smokeMachineDef["position"], smokeMachineDef["intensity"]
             )
             self.objectBins["smokeMachines"][smokeMachine_key] = smokeMachineObj
 
         for lightGroup_key in intObjectBins["lightGroups"]:
             lightGroupDef = intObjectBins["lightGroups"][lightGroup_key]
-            lightGroupObj = light.LightGroup([], [])
+            lightGroupObj = self.getSubsystem("lightgroup").LightGroup()
             for light_key in lightGroupDef["lights"]:
                 lightGroupObj.lights.append(self.objectBins["lights"][light_key])
             self.objectBins["lightGroups"][lightGroup_key] = lightGroupObj
+        # Groups can hold other groups with "lightgroups", they're linked once they've
+        # all been made so a group can name one that comes after it
+        self.linkLightGroups(intObjectBins["lightGroups"])
+        # Lights are kept in one rig of arrays, and every group is flattened into the
+        # indices of its lights there, so a group is set or drawn all at once
+        if self.objectBins["lights"]:
+            self.lightRig = self.getSubsystem("light").rigFromLights(
+                list(self.objectBins["lights"].values())
+            )
+        for lightGroupObj in self.objectBins["lightGroups"].values():
+            lightGroupObj.index()
 
         for smokeMachineVolume_key in intObjectBins["smokeMachineVolumes"]:
             smokeMachineVolumeDef = intObjectBins["smokeMachineVolumes"][
                 smokeMachineVolume_key
             ]
-            smokeMachineVolumeObj = smoke.SmokeMachineVolume(
+            smokeMachineVolumeObj = self.getSubsystem(
+                "smokemachinevolume"
+            ).SmokeMachineVolume(
                 self.stageInfo,
                 smokeMachineVolumeDef["colour"],
+                *self.getSmokeSettings(smokeMachineVolumeDef),
             )
+            if "pressure" in smokeMachineVolumeDef:
+                smokeMachineVolumeObj.volume.setSolve(smokeMachineVolumeDef["pressure"])
             for smokeMachine_key in smokeMachineVolumeDef["smokemachines"]:
                 smokeMachineVolumeObj.addMachine(
                     self.objectBins["smokeMachines"][smokeMachine_key]
@@ -112,46 +313,231 @@ class Choreography:
             self.objectBins["smokeMachineVolumes"][
                 smokeMachineVolume_key
             ] = smokeMachineVolumeObj
-        self.stage = stg.StageDraw(self.stageInfo)
 
-        self.steps = loadedJson["steps"]
+        if self.stepStream is None:
+            self.steps = loadedJson["steps"]
+        else:
+            self.steps = self.stepStream
+        self.timeline = tl.Timeline(self)
+        self.compileSteps()
+
+    # Adds the groups every light group names in its "lightgroups" to it, and works out
+    # which groups aren't inside another, a group can't end up inside itself
+    def linkLightGroups(self, lightGroupDefs: dict):
+        lightGroups = self.objectBins["lightGroups"]
+        inner = set()
+        for lightGroup_key, lightGroupDef in lightGroupDefs.items():
+            for child_key in lightGroupDef.get("lightgroups", []):
+                if child_key not in lightGroups:
+                    raise ValueError(
+                        f"Light group {lightGroup_key} has an unknown light group {child_key}"
+                    )
+                lightGroups[lightGroup_key].addLightGroup(lightGroups[child_key])
+                inner.add(child_key)
+
+        # Following the groups down from each one finds any loop, groups that have
+        # already been followed to the bottom are skipped
+        checked = set()
+
+        def visit(lightGroup_key, path):
+            if lightGroup_key in path:
+                raise ValueError(
+                    "Light groups inside themselves: "
+                    + " > ".join(path + [lightGroup_key])
+                )
+            if lightGroup_key in checked:
+                return
+            for child_key in lightGroupDefs[lightGroup_key].get("lightgroups", []):
+                visit(child_key, path + [lightGroup_key])
+            checked.add(lightGroup_key)
+
+        for lightGroup_key in lightGroupDefs:
+            visit(lightGroup_key, [])
+        self.outerLightGroups = [key for key in lightGroups if key not in inner]
+
+    # Compiles one step entry into an operation that takes no arguments,
+    # or None if the step does nothing
+    # A ValueError says what's wrong with the step, if it can't be compiled
+    def compileStep(self, step: list):
+        t = step[0]
+        if t == "buffer":
+            return makeOperation(
+                setattr, (self, "buffering", step[1]), [self], "buffering", step[1]
+            )
+        if t == "smokemachinevolume":
+            return None
+        if t not in self.objectMapping:
+            raise ValueError("unknown step type " + repr(t))
+
+        objects = self.objectBins[self.objectMapping[t][2]]
+        if step[1] not in objects:
+            raise ValueError(f"unknown {t} {step[1]!r}")
+        obj = objects[step[1]]
+        action = step[2]
+
+        # Colours and light group settings are given straight after the action
+        if t == "light" and action == "colour":
+            value = colour.Colour(step[3])
+            return makeOperation(
+                setattr, (obj, "colour", value), [obj], "colour", value
+            )
+        if t == "lightgroup":
+            if action not in ("colour", "intensity", "spread"):
+                raise ValueError(f"unknown lightgroup action {action!r}")
+            value = colour.Colour(step[3]) if action == "colour" else step[3]
+            # Every operation on a group shares the one list of its lights
+            if step[1] not in self.groupLights:
+                self.groupLights[step[1]] = obj.allLights()
+            return makeOperation(
+                obj.setAll, (action, value), self.groupLights[step[1]], action, value
+            )
+
+        attributes = stepAttributes.get(t, {})
+        if action not in attributes:
+            raise ValueError(f"unknown {t} action {action!r}")
+        operation = attributes[action](obj, action, step[3], step[4])
+        if operation is None:
+            raise ValueError(f"unknown {t} {action} operation {step[3]!r}")
+        return operation
+
+    # Compiles every entry of one step, leaving out the ones that do nothing
+    def compileOperations(self, thisStep: list):
+        operations = []
+        for step in thisStep:
+            operation = self.compileStep(step)
+            if operation is not None:
+                operations.append(operation)
+        return operations
+
+    # Compiles `steps` so ticks don't have to interpret them, and indexes them on the
+    # timeline, every problem with them is reported together before anything is run
+    # Streamed steps are read once here and not kept, they're compiled again as they're
+    # needed by ticks
+    def compileSteps(self):
+        self.groupLights = {}
+        compiledSteps = []
+        problems = []
+        for i, thisStep in enumerate(self.steps):
+            operations = []
+            for step in thisStep:
+                try:
+                    operation = self.compileStep(step)
+                except ValueError as e:
+                    problems.append(f"step {i}: {e}")
+                    continue
+                except (IndexError, TypeError):
+                    problems.append(f"step {i}: {step!r} is malformed")
+                    continue
+                if operation is not None:
+                    operations.append(operation)
+            self.timeline.addStep(operations)
+            if self.stepStream is None:
+                compiledSteps.append(operations)
+        if problems:
+            raise ValueError("Invalid steps:\n    " + "\n    ".join(problems))
+        self.timeline.finish()
+        if self.stepStream is None:
+            self.compiledSteps = compiledSteps
+        else:
+            self.compiledSteps = CompiledSteps(self.steps, self.compileOperations)
+
+    # Makes the stage for the render backend
+    # matplotlib is only imported once something is drawn with it, the object modules
+    # import it for type hints and inside their matplotlib drawing methods, so the numpy
+    # backend never loads it
+    def makeStage(self):
+        if self.backend == "numpy":
+            import compositor
+
+            self.stage = compositor.FrameCompositor(self.stageInfo)
+        else:
+            self.stage = stg.StageDraw(self.stageInfo)
 
     def draw(self):
         # Order:
         # Draw background
         # Draw props
+        # Mark the end of the static layers
         # Draw smoke
         # Draw lights
-        self.stage.draw()
+        with tracing.span("draw"):
+            for name, drawLayer in self.drawLayers():
+                with tracing.span("draw." + name):
+                    drawLayer()
+
+    # Layers of a frame as (name, function) pairs, in the order they're drawn, along with
+    # where the static layers end and the dynamic ones begin
+    def drawLayers(self):
+        return [
+            ("stage", self.stage.draw),
+            ("props", self.drawProps),
+            ("dynamic", self.beginDynamic),
+            ("smoke", self.drawSmoke),
+            ("lights", self.drawLights),
+        ]
 
+    # Each layer draws with artists, or into the `FrameCompositor` for the numpy backend
+
+    # Draws every prop
+    def drawProps(self):
         for prop_key in self.objectBins["props"]:
             propObj = self.objectBins["props"][prop_key]
-            propObj.draw(self.stage.sideAx)
+            if self.backend == "numpy":
+                propObj.composite(self.stage)
+            elif propObj.draw(self.stage.sideAx):
+                # Props are in the stage's cached background, so it's redone if one moved
+                self.stage.invalidate()
+
+    # Smoke and lights are the dynamic layers, drawn over the stage's cached background
+    # of everything drawn before them, the numpy backend has no cached background
+    def beginDynamic(self):
+        if self.backend != "numpy":
+            self.stage.beginDynamic()
 
+    # Draws every smoke machine volume
+    def drawSmoke(self):
         for smokeMachineVolume_key in self.objectBins["smokeMachineVolumes"]:
             smokeMachineVolumeObj = self.objectBins["smokeMachineVolumes"][
                 smokeMachineVolume_key
             ]
-            smokeMachineVolumeObj.draw(self.stage.sideAx)
+            if self.backend == "numpy":
+                smokeMachineVolumeObj.composite(self.stage)
+            else:
+                smokeMachineVolumeObj.draw(self.stage.sideAx)
 
-        for lightg_key in self.objectBins["lightGroups"]:
+    # Draws every light group that isn't inside another one, which draws the rest
+    def drawLights(self):
+        for lightg_key in self.outerLightGroups:
             lightGroupObj = self.objectBins["lightGroups"][lightg_key]
-            lightGroupObj.drawTopDown(self.stageInfo, self.stage.topAx)
-            lightGroupObj.draw2D(self.stageInfo, self.stage.sideAx)
+            if self.backend == "numpy":
+                lightGroupObj.compositeTopDown(self.stageInfo, self.stage)
+                lightGroupObj.composite2D(self.stageInfo, self.stage)
+            else:
+                lightGroupObj.drawTopDown(self.stageInfo, self.stage.topAx)
+                lightGroupObj.draw2D(self.stageInfo, self.stage.sideAx)
 
     stepFrame = 0
     buffering = (
         1  # we start off with one to have at least one frame with original state
     )
 
-    # Steps through things inside
+    # Steps through things inside, one smoke step and one choreography tick
     def step(self):
+        with tracing.span("step"):
+            self.stepSmoke()
+            self.tick()
+
+    # Steps every smoke simulation forward by one `Volume.timeStep`
+    def stepSmoke(self):
         for smokeMachineVolume_key in self.objectBins["smokeMachineVolumes"]:
             smokeMachineVolumeObj = self.objectBins["smokeMachineVolumes"][
                 smokeMachineVolume_key
             ]
-            smokeMachineVolumeObj.step()
+            with tracing.span("smoke.step", key=smokeMachineVolume_key):
+                smokeMachineVolumeObj.step()
 
+    # Moves the choreography on by one tick, `buffer` steps are counted in ticks
+    def tick(self):
         # We use buffering so that we can alter the speed of the choreography
         if self.buffering > 0:
             self.buffering -= 1
@@ -159,136 +545,94 @@ class Choreography:
         if self.buffering > 0:
             return
 
-        thisStep = self.steps[self.stepFrame]
-        for step in thisStep:
-            t = step[0]
-            # ideally there'd be a switch statement but python doesn't have one
-            # (it has match but it doesn't work nicely)
-            if t == "light":
-                name = step[1]
-                lightObj = self.objectBins["lights"][name]
-                action = step[2]
-                arg = step[3]
-                if action == "position":
-                    if arg == "add":
-                        lightObj.position += step[4]
-                    elif arg == "set":
-                        lightObj.position = step[4]
-                    elif arg == "sub":
-                        lightObj.position -= step[4]
-                    else:
-                        print("Unknown light action: " + arg)
-                elif action == "direction":
-                    if arg == "add":
-                        lightObj.direction += step[4]
-                    elif arg == "set":
-                        lightObj.direction = step[4]
-                    elif arg == "sub":
-                        lightObj.direction -= step[4]
-                    else:
-                        print("Unknown light action: " + arg)
-                elif action == "intensity":
-                    if arg == "add":
-                        lightObj.intensity += step[4]
-                    elif arg == "set":
-                        lightObj.intensity = step[4]
-                    elif arg == "sub":
-                        lightObj.intensity -= step[4]
-                    else:
-                        print("Unknown light action: " + arg)
-                elif action == "colour":
-                    lightObj.colour = colour.Colour(step[3])
-                pass
-            elif t == "prop":
-                name = step[1]
-                propObj = self.objectBins["props"][name]
-                action = step[2]
-                arg = step[3]
-                if action == "position":
-                    if arg == "add":
-                        propObj.position = (
-                            propObj.position[0] + step[4][0],
-                            propObj.position[1] + step[4][1],
-                        )
-                    elif arg == "set":
-                        propObj.position = (
-                            step[4][0],
-                            step[4][1],
-                        )
-                    elif arg == "sub":
-                        propObj.position = (
-                            propObj.position[0] - step[4][0],
-                            propObj.position[1] - step[4][1],
-                        )
-                    else:
-                        print("Unknown prop action: " + arg)
-                elif action == "scale":
-                    if arg == "add":
-                        propObj.scale += step[4]
-                    elif arg == "set":
-                        propObj.scale = step[4]
-                    elif arg == "sub":
-                        propObj.scale -= step[4]
-                    else:
-                        print("Unknown prop action: " + arg)
-                pass
-            elif t == "smokemachine":
-                name = step[1]
-                smokemachineObj = self.objectBins["smokeMachines"][name]
-                action = step[2]
-                arg = step[3]
-                if action == "position":
-                    if arg == "add":
-                        smokemachineObj.position = (
-                            smokemachineObj.position[0] + step[4][0],
-                            smokemachineObj.position[1] + step[4][1],
-                        )
-                    elif arg == "set":
-                        smokemachineObj.position = (
-                            step[4][0],
-                            step[4][1],
-                        )
-                    elif arg == "sub":
-                        smokemachineObj.position = (
-                            smokemachineObj.position[0] - step[4][0],
-                            smokemachineObj.position[1] - step[4][1],
-                        )
-                    else:
-                        print("Unknown smokemachine action: " + arg)
-                elif action == "intensity":
-                    if arg == "add":
-                        smokemachineObj.intensity += step[4]
-                    elif arg == "set":
-                        smokemachineObj.intensity = step[4]
-                    elif arg == "sub":
-                        smokemachineObj.intensity -= step[4]
-                    else:
-                        print("Unknown smokemachine action: " + arg)
-                pass
-            elif t == "lightgroup":
-                name = step[1]
-                lightGroupObj = self.objectBins["lightGroups"][name]
-                action = step[2]
-                arg = step[3]
-                if action == "colour":
-                    lightGroupObj.setColour(colour.Colour(step[3]))
-                elif action == "intensity":
-                    lightGroupObj.setIntensity(step[3])
-                elif action == "spread":
-                    lightGroupObj.setSpread(step[3])
-                else:
-                    print("Unknown lightgroup action: " + arg)
-            elif t == "smokemachinevolume":
-                pass
-            elif t == "buffer":
-                self.buffering = step[1]
-            else:
-                print("Unknown step type: " + t)
+        for operation in self.compiledSteps[self.stepFrame]:
+            operation()
 
         # Animations are looping, and will be reset to the first frame after it's done
         # with the sequence
         self.stepFrame = (self.stepFrame + 1) % len(self.steps)
 
+    # Jumps to the state after `ticks` calls to `tick`, forwards or backwards
+    # Smoke isn't on the timeline, it has to be simulated one step at a time
+    def seek(self, ticks: int):
+        self.timeline.seek(ticks)
+
+    # Values every frame is drawn from, or None while there's smoke that could be moving
+    # Frames drawn from equal values look the same
+    def frameState(self):
+        for smokeMachineVolumeObj in self.objectBins["smokeMachineVolumes"].values():
+            if smokeMachineVolumeObj.isActive():
+                return None
+        return self.timeline.record()
+
+    # Everything that changes as the choreography runs, as named arrays
+    def getState(self):
+        state = {
+            "stepFrame": np.array(self.stepFrame),
+            "buffering": np.array(self.buffering),
+            # Object attributes are few and small, so they're kept as JSON
+            "objects": np.array(
+                json.dumps([encodeValue(v) for v in self.timeline.record()])
+            ),
+        }
+        for key, volume in self.objectBins["smokeMachineVolumes"].items():
+            for name, values in volume.volume.getState().items():
+                state["volume." + key + "." + name] = values
+        return state
+
+    # Puts back the state from `getState`, the choreography has to be parsed from the
+    # same file the state came from
+    def setState(self, state):
+        self.stepFrame = int(state["stepFrame"])
+        self.buffering = int(state["buffering"])
+        values = [decodeValue(v) for v in json.loads(str(state["objects"]))]
+        if len(values) != len(self.timeline.targets):
+            raise ValueError("State doesn't match this choreography's objects")
+        self.timeline.restore(values)
+        for key, volume in self.objectBins["smokeMachineVolumes"].items():
+            prefix = "volume." + key + "."
+            volume.volume.setState(
+                {
+                    name[len(prefix) :]: state[name]
+                    for name in state
+                    if name.startswith(prefix)
+                }
+            )
+
+    # Saves a compressed checkpoint of the state, with whatever `cursor` holds about
+    # where the render is up to
+    # It's written to a temporary file first, so a crash never leaves half a checkpoint
+    def saveCheckpoint(self, filename: str, cursor: dict):
+        arrays = self.getState()
+        for name, value in cursor.items():
+            arrays["cursor." + name] = np.array(value)
+        with open(filename + ".tmp", "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(filename + ".tmp", filename)
+
+    # Loads a checkpoint from `saveCheckpoint`, giving back its cursor
+    def loadCheckpoint(self, filename: str):
+        with np.load(filename) as checkpoint:
+            state = {name: checkpoint[name] for name in checkpoint.files}
+        self.setState(state)
+        return {
+            name[len("cursor.") :]: state[name].item()
+            for name in state
+            if name.startswith("cursor.")
+        }
+
+    # Iterations the last pressure solve took, for every smoke machine volume
+    def solverIterations(self):
+        iterations = {}
+        for smokeMachineVolume_key in self.objectBins["smokeMachineVolumes"]:
+            volume = self.objectBins["smokeMachineVolumes"][
+                smokeMachineVolume_key
+            ].volume
+            if volume.lastIterations is not None:
+                iterations[smokeMachineVolume_key] = volume.lastIterations
+        return iterations
+
     # Cleans the stage for next frame
     def clean(self):
-        self.stage.clean()
+        with tracing.span("clean"):
+            self.stage.clean()
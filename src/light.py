@@ -5,8 +5,6 @@
 # a light source in the scene.
 
 # Dependencies
-import matplotlib.pyplot as plt
-import matplotlib.patches as pltpatches
 import numpy as np
 
 import stage
@@ -14,44 +12,157 @@ import colour as col
 import constants as c
 
 import math  # Python included
+from typing import TYPE_CHECKING  # Python included
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+
+# An attribute of a `Light` that's kept in the array of the same name in its `LightRig`
+def rigAttribute(name: str):
+    return property(
+        lambda self: getattr(self.rig, name)[self.index].item(),
+        lambda self, value: getattr(self.rig, name).__setitem__(self.index, value),
+    )
+
+
+# Lights kept as arrays, one entry per light, so many of them can be changed and drawn
+# at once. Every `Light` is an index into a rig, they start in one of their own and
+# `rigFromLights` moves them into a shared one.
+class LightRig:
+    position: np.ndarray  # Position of every light
+    direction: np.ndarray  # Direction of every light
+    intensity: np.ndarray  # Intensity of every light
+    spread: np.ndarray  # Spread of every light
+    colourIndex: np.ndarray  # Index of every light's colour in `colours`
+    colours: list  # Every colour in the rig, each value is only kept once
+    colourIds: dict  # Index in `colours` of every raw colour
+    lights: list  # `Light` for every entry
+
+    # Constructor for a `LightRig`, with no lights in it
+    def __init__(self):
+        self.position = np.zeros(0)
+        self.direction = np.zeros(0)
+        self.intensity = np.zeros(0)
+        self.spread = np.zeros(0)
+        self.colourIndex = np.zeros(0, dtype=np.int32)
+        self.colours = []
+        self.colourIds = {}
+        self.lights = []
+
+    # Index of `colour` in `colours`, adding it if it's new
+    def colourId(self, colour: col.Colour):
+        key = repr(colour.rawColour)
+        if key not in self.colourIds:
+            self.colourIds[key] = len(self.colours)
+            self.colours.append(colour)
+        return self.colourIds[key]
+
+    # Adds a light's values to the end of the rig, giving its index
+    def add(self, light, colour, position, direction, intensity, spread):
+        self.position = np.append(self.position, position)
+        self.direction = np.append(self.direction, direction)
+        self.intensity = np.append(self.intensity, intensity)
+        self.spread = np.append(self.spread, spread)
+        self.colourIndex = np.append(self.colourIndex, self.colourId(colour)).astype(
+            np.int32
+        )
+        self.lights.append(light)
+        return len(self.lights) - 1
+
+    # Sets `attribute` of the lights at `indices` to `value` in one go
+    def set(self, attribute: str, indices: np.ndarray, value):
+        if attribute == "colour":
+            self.colourIndex[indices] = self.colourId(value)
+        else:
+            getattr(self, attribute)[indices] = value
+
+
+# Moves `lights` into one new rig, keeping their values, and gives it back
+def rigFromLights(lights: list):
+    rig = LightRig()
+    rig.position = np.array([light.position for light in lights], dtype=np.float64)
+    rig.direction = np.array([light.direction for light in lights], dtype=np.float64)
+    rig.intensity = np.array([light.intensity for light in lights], dtype=np.float64)
+    rig.spread = np.array([light.spread for light in lights], dtype=np.float64)
+    rig.colourIndex = np.array(
+        [rig.colourId(light.colour) for light in lights], dtype=np.int32
+    )
+    rig.lights = list(lights)
+    for i, light in enumerate(lights):
+        light.rig, light.index = rig, i
+    return rig
 
 
 class Light:
-    colour: col.Colour  # Colour
-    position: float  # a 1D representation of the light's position, as it is fixed on the ceiling in a 2D
-    direction: int  # 0-180, 0 is facing right, 90 is facing down, 180 is facing left
-    intensity: float  # 0-11, 0 is off, 11 is brightest
-    spread: int  # 0-120, cone of light spread, 0 is a laser, 120 is a flood light
+    rig: LightRig  # Rig the light's values are kept in
+    index: int  # Index of the light in its rig
+    # Values are kept in the rig, reading or setting one goes to its array there
+    # Colour
+    colour = property(
+        lambda self: self.rig.colours[self.rig.colourIndex[self.index]],
+        lambda self, value: self.rig.set("colour", self.index, value),
+    )
+    # a 1D representation of the light's position, as it is fixed on the ceiling in a 2D
+    position = rigAttribute("position")
+    # 0-180, 0 is facing right, 90 is facing down, 180 is facing left
+    direction = rigAttribute("direction")
+    # 0-11, 0 is off, 11 is brightest
+    intensity = rigAttribute("intensity")
+    # 0-120, cone of light spread, 0 is a laser, 120 is a flood light
+    spread = rigAttribute("spread")
+
+    # Artists are kept between frames and updated in place
+    topDownArtist = None  # Circle in the topdown view
+    coneArtist = None  # Gradient image in the audience view
+    conePatch = None  # Cone polygon the gradient is clipped to
 
     # Constructor for a `Light`
     def __init__(
         self, colour=col.Colour(), position=0.0, direction=90, intensity=5, spread=25
     ):
-        self.colour = colour
-        self.position = position
-        self.direction = direction
-        self.intensity = intensity
-        self.spread = spread
+        self.rig = LightRig()
+        self.index = self.rig.add(self, colour, position, direction, intensity, spread)
 
-    # Draws the light from a topdown perspective on the plt axes
-    def drawTopDown(self, stageInfo: stage.StageDescriptor, ax: plt.Axes):
+    # Centre of the light's circle in the topdown view
+    def topDownCentre(self, stageInfo: stage.StageDescriptor):
         # Position is from the middle of the stage
         middleOfStage = stageInfo.width / 2
-        lightCirclePosition = [middleOfStage + self.position, c.LIGHT_SOURCE_RADIUS]  # type: ignore
+        return [middleOfStage + self.position, c.LIGHT_SOURCE_RADIUS]  # type: ignore
+
+    # Draws the light from a topdown perspective on the plt axes
+    def drawTopDown(self, stageInfo: stage.StageDescriptor, ax: "plt.Axes"):
+        lightCirclePosition = self.topDownCentre(stageInfo)
         lightCircleRadius = c.LIGHT_SOURCE_RADIUS
         # Colour can be a list of colours, or a singular colour
         lightColour = self.colour.getColourIndex(0)  # type: ignore
-        lightCircle = pltpatches.Circle(
-            lightCirclePosition,
-            lightCircleRadius,
-            color=lightColour,
-            alpha=self.intensity / 11,  # type: ignore
-            linewidth=0,
+        if self.topDownArtist is None or self.topDownArtist.axes is not ax:
+            import matplotlib.patches as pltpatches
+
+            self.topDownArtist = pltpatches.Circle(
+                lightCirclePosition,
+                lightCircleRadius,
+                color=lightColour,
+                alpha=self.intensity / 11,  # type: ignore
+                linewidth=0,
+            )
+            ax.add_patch(self.topDownArtist)
+        else:
+            self.topDownArtist.set_center(lightCirclePosition)
+            self.topDownArtist.set_color(lightColour)
+            self.topDownArtist.set_alpha(self.intensity / 11)  # type: ignore
+
+    # Draws the light from a topdown perspective into a `FrameCompositor`
+    def compositeTopDown(self, stageInfo: stage.StageDescriptor, comp):
+        comp.fillCircle(
+            self.topDownCentre(stageInfo),
+            c.LIGHT_SOURCE_RADIUS,
+            self.colour.getColourIndex(0),  # type: ignore
+            self.intensity / 11,  # type: ignore
         )
-        ax.add_patch(lightCircle)
 
-    # Draws the light from the audience's perspective on the plt axes
-    def draw2D(self, stageInfo, ax: plt.Axes):
+    # Corners of the cone of light in the audience's perspective
+    def conePoints(self, stageInfo: stage.StageDescriptor):
         middleOfStage = stageInfo.width / 2
         LightConeBeamCentral = [middleOfStage + self.position, stageInfo.height]
         LightConeBeamLeftUpper = [
@@ -74,102 +185,260 @@ class Light:
             LightConeBeamCentral[0] + shift + spread / 2,
             0,
         ]
-        points = [
+        return [
             LightConeBeamLeftUpper,
             LightConeBeamRightUpper,
             LightConeBeamRightLower,
             LightConeBeamLeftLower,
         ]
 
+    # Draws the light from the audience's perspective on the plt axes
+    def draw2D(self, stageInfo, ax: "plt.Axes"):
+        points = self.conePoints(stageInfo)
+
         # Uses a function to create or get a gradient from these two colours
         cmap = col.getOrMakeCMAP(
             self.colour.getColourIndex(0), self.colour.getColourIndex(1)  # type: ignore
         )
-        # Creates topdown gradient
-        gradient = np.atleast_2d(np.linspace(0, 1, stageInfo.height)).T
-        poly = pltpatches.Polygon(points, facecolor="none", edgecolor="none")  # type: ignore
-        im = ax.imshow(
-            gradient,
-            cmap=cmap,
-            extent=[0, stageInfo.width, 0, stageInfo.height],
-            interpolation="nearest",
-            alpha=self.intensity / 11,  # type: ignore
+        if self.coneArtist is None or self.coneArtist.axes is not ax:
+            import matplotlib.patches as pltpatches
+
+            # Creates topdown gradient
+            gradient = np.atleast_2d(np.linspace(0, 1, stageInfo.height)).T
+            self.conePatch = pltpatches.Polygon(points, facecolor="none", edgecolor="none")  # type: ignore
+            self.coneArtist = ax.imshow(
+                gradient,
+                cmap=cmap,
+                extent=[0, stageInfo.width, 0, stageInfo.height],
+                interpolation="nearest",
+                alpha=self.intensity / 11,  # type: ignore
+            )
+            ax.add_patch(self.conePatch)
+            self.coneArtist.set_clip_path(self.conePatch)  # type: ignore
+        else:
+            # The clip path follows the polygon, so moving it moves the cone
+            self.conePatch.set_xy(points)  # type: ignore
+            self.coneArtist.set_cmap(cmap)
+            self.coneArtist.set_alpha(self.intensity / 11)  # type: ignore
+
+    # Draws the light from the audience's perspective into a `FrameCompositor`
+    def composite2D(self, stageInfo: stage.StageDescriptor, comp):
+        cmap = col.getOrMakeCMAP(
+            self.colour.getColourIndex(0), self.colour.getColourIndex(1)  # type: ignore
+        )
+        comp.fillCone(
+            self.conePoints(stageInfo),
+            col.getOrMakeGradient(cmap, int(stageInfo.height)),
+            self.intensity / 11,  # type: ignore
         )
-        ax.add_patch(poly)
-        im.set_clip_path(poly)  # type: ignore
+
+
+# Blends the cones of light of the lights at `indices` in `rig` into `view`, in order,
+# like `Light.conePoints` would outline them. Rows of `view` are at heights `ys` and
+# columns at `xs` on the stage. Its colour is premultiplied by its alpha, so an opaque
+# frame or a clear layer both work.
+def blendCones(
+    view: np.ndarray,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    stageInfo: stage.StageDescriptor,
+    rig: LightRig,
+    indices: np.ndarray,
+):
+    # The edges of every cone along every row are worked out together, [light, row]
+    length = stageInfo.height + c.LIGHT_SOURCE_RADIUS
+    halfWidth = length * np.sin(np.radians(rig.spread[indices] / 2)) / 2
+    shift = length * np.cos(np.radians(rig.direction[indices]))
+    centre = stageInfo.width / 2 + rig.position[indices]
+    # How far down the cone each row is, 0 at the top and 1 at the bottom
+    t = (stageInfo.height - ys) / stageInfo.height
+    lefts = (centre - c.LIGHT_SOURCE_RADIUS)[:, None] + (
+        shift - halfWidth + c.LIGHT_SOURCE_RADIUS
+    )[:, None] * t
+    rights = (centre + c.LIGHT_SOURCE_RADIUS)[:, None] + (
+        shift + halfWidth - c.LIGHT_SOURCE_RADIUS
+    )[:, None] * t
+    alphas = (rig.intensity[indices] / 11).astype(np.float32)
+    colours = rig.colourIndex[indices]
+
+    for i in range(len(indices)):
+        # Only the columns the cone can reach are blended
+        first = np.searchsorted(xs, lefts[i].min(), side="left")
+        last = np.searchsorted(xs, rights[i].max(), side="right")
+        if first >= last:
+            continue
+        colour = rig.colours[colours[i]]
+        cmap = col.getOrMakeCMAP(colour.getColourIndex(0), colour.getColourIndex(1))
+        gradient = col.getOrMakeGradient(cmap, len(ys))
+        inside = (xs[first:last] >= lefts[i][:, None]) & (
+            xs[first:last] <= rights[i][:, None]
+        )
+        alpha = inside * (gradient[:, None, 3] * alphas[i])
+        target = view[:, first:last]
+        target[..., :3] += (gradient[:, None, :3] - target[..., :3]) * alpha[..., None]
+        target[..., 3] += (1 - target[..., 3]) * alpha
 
 
 # Collection of lights and/or light groups
 # Manages them a
+# Groups of more than `LIGHT_BATCH_THRESHOLD` lights draw every cone into one image
 class LightGroup:
-    lights = []
-    lightGroups = []
+    lights: list  # Lights directly in the group
+    lightGroups: list  # Light groups directly inside the group
+    rig = None  # `LightRig` the group's lights are in, once the group is indexed
+    indices = None  # Index in `rig` of every light in the group or inside it, once each
+    coneLayer = None  # Premultiplied cones of every light, when drawn together
+    coneImage = None  # `coneLayer` with its colour divided back out, for `imshow`
+    coneArtist = None  # Image artist showing `coneImage`
 
     # Constructor for a `LightGroup`
-    def __init__(self, lights=[], lightGroups=[]):
-        self.lights = lights
-        self.lightGroups = lightGroups
+    def __init__(self, lights=None, lightGroups=None):
+        self.lights = [] if lights is None else lights
+        self.lightGroups = [] if lightGroups is None else lightGroups
+
+    # Every light in the group and the groups inside it, once each, in drawing order
+    # Each group is only looked in once, so groups inside each other can't loop forever
+    def allLights(self):
+        found = []
+        seen = set()
+
+        def gather(lightGroup):
+            if id(lightGroup) in seen:
+                return
+            seen.add(id(lightGroup))
+            for light in lightGroup.lights:
+                if id(light) not in seen:
+                    seen.add(id(light))
+                    found.append(light)
+            for inner in lightGroup.lightGroups:
+                gather(inner)
 
-    # Adds a light to the group
+        gather(self)
+        return found
+
+    # Flattens the group into the indices of all of its lights in their rig, so setting
+    # or drawing them is done on the rig's arrays in one go
+    # Only possible when they share a rig, see `rigFromLights`
+    def index(self):
+        lights = self.allLights()
+        if not lights or any(light.rig is not lights[0].rig for light in lights):
+            self.rig, self.indices = None, None
+            return
+        self.rig = lights[0].rig
+        self.indices = np.array([light.index for light in lights], dtype=np.intp)
+
+    # Whether the cones of `lights`, every light in the group, are drawn together, which
+    # they are when there are more than `LIGHT_BATCH_THRESHOLD` of them in one rig
+    # The group is indexed here if it hasn't been, or if lights were added to it since
+    def batchesCones(self, lights: list):
+        if len(lights) <= c.LIGHT_BATCH_THRESHOLD:
+            return False
+        if self.indices is None or len(self.indices) != len(lights):
+            self.index()
+        return self.indices is not None
+
+    # Adds a light to the group, the group has to be indexed again after
     def addLight(self, light):
         self.lights.append(light)
+        self.rig, self.indices = None, None
 
-    # Adds a light group to the group
+    # Adds a light group to the group, the group has to be indexed again after
     def addLightGroup(self, lightGroup):
         self.lightGroups.append(lightGroup)
+        self.rig, self.indices = None, None
 
-    # Iterates through all and draws them top down
-    def drawTopDown(self, stageInfo: stage.StageDescriptor, ax: plt.Axes):
-        for light in self.lights:
+    # Draws every light in the group and the groups inside it top down, once each
+    def drawTopDown(self, stageInfo: stage.StageDescriptor, ax: "plt.Axes"):
+        for light in self.allLights():
             light.drawTopDown(stageInfo, ax)
-        for lightGroup in self.lightGroups:
-            if lightGroup != self:
-                lightGroup.drawTopDown(stageInfo, ax)
 
-    # Iterates through all and draws them from the audience's perspective
-    def draw2D(self, stageInfo: stage.StageDescriptor, ax: plt.Axes):
-        for light in self.lights:
+    # Draws every light in the group and the groups inside it from the audience's
+    # perspective, once each
+    def draw2D(self, stageInfo: stage.StageDescriptor, ax: "plt.Axes"):
+        lights = self.allLights()
+        if self.batchesCones(lights):
+            self.drawCones(stageInfo, ax)
+            return
+        for light in lights:
             light.draw2D(stageInfo, ax)
-        for lightGroup in self.lightGroups:
-            if lightGroup != self:
-                lightGroup.draw2D(stageInfo, ax)
+
+    # Composites every light in the group and the groups inside it top down, once each
+    def compositeTopDown(self, stageInfo: stage.StageDescriptor, comp):
+        for light in self.allLights():
+            light.compositeTopDown(stageInfo, comp)
+
+    # Draws the cones of every light as one image, made `LIGHT_LAYER_RESOLUTION` pixels
+    # to a unit of stage, the image artist is made on the first draw and updated after that
+    def drawCones(self, stageInfo: stage.StageDescriptor, ax: "plt.Axes"):
+        rows = int(stageInfo.height * c.LIGHT_LAYER_RESOLUTION)
+        cols = int(stageInfo.width * c.LIGHT_LAYER_RESOLUTION)
+        if self.coneLayer is None or self.coneLayer.shape[:2] != (rows, cols):
+            self.coneLayer = np.zeros((rows, cols, 4), dtype=np.float32)
+            self.coneImage = np.zeros((rows, cols, 4), dtype=np.float32)
+            # Stage coordinates of the centre of every pixel, row 0 is the top
+            self.coneXs = (np.arange(cols) + 0.5) / c.LIGHT_LAYER_RESOLUTION
+            self.coneYs = (
+                stageInfo.height - (np.arange(rows) + 0.5) / c.LIGHT_LAYER_RESOLUTION
+            )
+        else:
+            self.coneLayer[...] = 0
+        blendCones(
+            self.coneLayer, self.coneXs, self.coneYs, stageInfo, self.rig, self.indices
+        )
+
+        # imshow wants colour that isn't premultiplied
+        alpha = self.coneLayer[..., 3:]
+        self.coneImage[..., :3] = 0
+        np.divide(
+            self.coneLayer[..., :3], alpha, out=self.coneImage[..., :3], where=alpha > 0
+        )
+        self.coneImage[..., 3:] = alpha
+        if self.coneArtist is None or self.coneArtist.axes is not ax:
+            self.coneArtist = ax.imshow(
+                self.coneImage,
+                extent=[0, stageInfo.width, 0, stageInfo.height],
+                interpolation="nearest",
+            )
+        else:
+            self.coneArtist.set_data(self.coneImage)
+
+    # Composites every light in the group and the groups inside it from the audience's
+    # perspective, once each
+    def composite2D(self, stageInfo: stage.StageDescriptor, comp):
+        lights = self.allLights()
+        if self.batchesCones(lights):
+            blendCones(
+                comp.side, comp.xs, comp.sideYs, stageInfo, self.rig, self.indices
+            )
+            return
+        for light in lights:
+            light.composite2D(stageInfo, comp)
+
+    # Sets `attribute` of every light in the group and the groups inside it, with one
+    # assignment to the rig's array once the group is indexed
+    def setAll(self, attribute: str, value):
+        if self.indices is not None:
+            self.rig.set(attribute, self.indices, value)
+            return
+        for light in self.allLights():
+            setattr(light, attribute, value)
 
     # Sets the colour of all lights in the group
     def setColour(self, colour):
-        for light in self.lights:
-            light.colour = colour
-        for lightGroup in self.lightGroups:
-            if lightGroup != self:
-                lightGroup.setColour(colour)
+        self.setAll("colour", colour)
 
     # Sets the position of all lights in the group
     def setPosition(self, position):
-        for light in self.lights:
-            light.position = position
-        for lightGroup in self.lightGroups:
-            if lightGroup != self:
-                lightGroup.setPosition(position)
+        self.setAll("position", position)
 
     # Sets the direction of all lights in the group
     def setDirection(self, direction):
-        for light in self.lights:
-            light.direction = direction
-        for lightGroup in self.lightGroups:
-            if lightGroup != self:
-                lightGroup.setDirection(direction)
+        self.setAll("direction", direction)
 
     # Sets the intensity of all lights in the group
     def setIntensity(self, intensity):
-        for light in self.lights:
-            light.intensity = intensity
-        for lightGroup in self.lightGroups:
-            if lightGroup != self:
-                lightGroup.setIntensity(intensity)
+        self.setAll("intensity", intensity)
 
     # Sets the spread of all lights in the group
     def setSpread(self, spread):
-        for light in self.lights:
-            light.spread = spread
-        for lightGroup in self.lightGroups:
-            if lightGroup != self:
-                lightGroup.setSpread(spread)
+        self.setAll("spread", spread)
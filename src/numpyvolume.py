@@ -0,0 +1,199 @@
+# numpyvolume.py
+# Lodinu Kalugalage
+#
+# Description: This file contains NumpyVolume, a small smoke solver written with just NumPy.
+# It follows the same steps as the phiflow `Volume` and can be used in its place.
+
+# Dependencies
+import numpy as np
+
+import constants as c
+import stage as stg
+
+
+# Bilinearly samples `values` at fractional indices `fx`, `fy`
+# Outside of the grid the values are extended with `mode` ("edge" or "constant" zero),
+# `limits` also returns the smallest and largest of the four values that were mixed
+def sampleGrid(
+    values: np.ndarray, fx: np.ndarray, fy: np.ndarray, mode: str, limits=False
+):
+    padded = np.pad(values, 1, mode=mode)
+    fx = np.clip(fx + 1, 0, padded.shape[0] - 1)
+    fy = np.clip(fy + 1, 0, padded.shape[1] - 1)
+    x0 = np.minimum(fx.astype(int), padded.shape[0] - 2)
+    y0 = np.minimum(fy.astype(int), padded.shape[1] - 2)
+    tx = fx - x0
+    ty = fy - y0
+
+    v00 = padded[x0, y0]
+    v10 = padded[x0 + 1, y0]
+    v01 = padded[x0, y0 + 1]
+    v11 = padded[x0 + 1, y0 + 1]
+    sampled = (v00 * (1 - tx) + v10 * tx) * (1 - ty) + (v01 * (1 - tx) + v11 * tx) * ty
+    if not limits:
+        return sampled
+    lower = np.minimum(np.minimum(v00, v10), np.minimum(v01, v11))
+    upper = np.maximum(np.maximum(v00, v10), np.maximum(v01, v11))
+    return sampled, lower, upper
+
+
+class NumpyVolume:
+    stageInfo: stg.StageDescriptor  # Stage descriptor
+
+    resolution: float  # Grid cells per unit of stage
+    x: int
+    y: int
+    dx: float  # Width of a cell in stage units
+    dy: float  # Height of a cell in stage units
+
+    timeStep = 1.0
+    decay = 0.0
+    buoyancy = 4.0  # Upwards force per unit of smoke, the same as the phiflow `Volume`
+
+    # Fields are indexed [x, y] like the phiflow grids
+    # The velocity is staggered, `u` is on the faces between cells along x (x + 1 of them)
+    # and `v` on the faces between cells along y, the faces on the walls are always zero
+    smoke: np.ndarray  # Smoke density, [x, y]
+    u: np.ndarray  # Velocity along x, [x + 1, y]
+    v: np.ndarray  # Velocity along y, [x, y + 1]
+    lastIterations = None  # The projection is solved directly, so this is never set
+
+    # Constructor for a `NumpyVolume`
+    def __init__(
+        self, stageInfo: stg.StageDescriptor, resolution=c.SMOKE_SIM_RESOLUTION
+    ):
+        self.stageInfo = stageInfo
+        self.resolution = resolution
+        self.x, self.y = int(stageInfo.width * resolution), int(
+            stageInfo.height * resolution
+        )
+        self.dx = stageInfo.width / self.x
+        self.dy = stageInfo.height / self.y
+
+        self.smoke = np.zeros((self.x, self.y), dtype=np.float32)
+        self.u = np.zeros((self.x + 1, self.y), dtype=np.float32)
+        self.v = np.zeros((self.x, self.y + 1), dtype=np.float32)
+
+        # Index coordinates of the cell centres and of both kinds of face
+        self.cellX, self.cellY = np.meshgrid(
+            np.arange(self.x, dtype=np.float32),
+            np.arange(self.y, dtype=np.float32),
+            indexing="ij",
+        )
+        self.uX, self.uY = np.meshgrid(
+            np.arange(1, self.x, dtype=np.float32),
+            np.arange(self.y, dtype=np.float32),
+            indexing="ij",
+        )
+        self.vX, self.vY = np.meshgrid(
+            np.arange(self.x, dtype=np.float32),
+            np.arange(1, self.y, dtype=np.float32),
+            indexing="ij",
+        )
+
+        # Eigenvalues of the cell centred Laplacian with closed walls, on the grid
+        # mirrored in both directions so a real FFT can solve it directly
+        kx = np.arange(2 * self.x)[:, None]
+        ky = np.arange(self.y + 1)[None, :]
+        eigen = (2 * np.cos(np.pi * kx / self.x) - 2) / self.dx**2 + (
+            2 * np.cos(np.pi * ky / self.y) - 2
+        ) / self.dy**2
+        eigen[0, 0] = 1  # The constant pressure offset is free, it's zeroed below
+        self.inverseEigen = 1 / eigen
+        self.inverseEigen[0, 0] = 0
+
+    # The solve is direct, so there are no pressure solve settings to use
+    def setSolve(self, solveDef: dict):
+        pass
+
+    # Samples a sphere onto the grid, giving how much of every cell it covers, [x, y]
+    def sampleSphere(self, position, radius: float):
+        # Supersampled so the edge of the sphere is smooth like the phiflow version
+        samples = 4
+        offsets = (np.arange(samples) + 0.5) / samples - 0.5
+        covered = np.zeros((self.x, self.y), dtype=np.float32)
+        for ox in offsets:
+            for oy in offsets:
+                px = (self.cellX + 0.5 + ox) * self.dx - position[0]
+                py = (self.cellY + 0.5 + oy) * self.dy - position[1]
+                covered += px**2 + py**2 <= radius**2
+        return covered / samples**2
+
+    # Inflow is used as it is
+    def makeInflow(self, values: np.ndarray):
+        return values
+
+    # Velocity at the cell centres, in cells per time step
+    def cellVelocity(self):
+        return (
+            (self.u[:-1] + self.u[1:]) * (0.5 * self.timeStep / self.dx),
+            (self.v[:, :-1] + self.v[:, 1:]) * (0.5 * self.timeStep / self.dy),
+        )
+
+    # MacCormack advection of the smoke, clamped to the cells it was sampled from
+    def advectSmoke(self):
+        cu, cv = self.cellVelocity()
+        semiLa, lower, upper = sampleGrid(
+            self.smoke, self.cellX - cu, self.cellY - cv, "edge", limits=True
+        )
+        inverse = sampleGrid(semiLa, self.cellX + cu, self.cellY + cv, "edge")
+        corrected = semiLa + 0.5 * (self.smoke - inverse)
+        return np.clip(corrected, lower, upper)
+
+    # Semi-Lagrangian advection of the velocity along itself
+    def advectVelocity(self):
+        cu, cv = self.cellVelocity()
+        u = np.zeros_like(self.u)
+        v = np.zeros_like(self.v)
+        # Velocity across each inner face comes from the two cells either side of it
+        uAlongY = (cv[:-1] + cv[1:]) * 0.5
+        vAlongX = (cu[:, :-1] + cu[:, 1:]) * 0.5
+        u[1:-1] = sampleGrid(
+            self.u,
+            self.uX - self.u[1:-1] * (self.timeStep / self.dx),
+            self.uY - uAlongY,
+            "constant",
+        )
+        v[:, 1:-1] = sampleGrid(
+            self.v,
+            self.vX - vAlongX,
+            self.vY - self.v[:, 1:-1] * (self.timeStep / self.dy),
+            "constant",
+        )
+        return u, v
+
+    # Removes the divergence from the velocity, solving for the pressure with an FFT
+    def project(self):
+        divergence = (self.u[1:] - self.u[:-1]) / self.dx + (
+            self.v[:, 1:] - self.v[:, :-1]
+        ) / self.dy
+        # Mirroring makes the closed walls (no flow through them) periodic
+        mirrored = np.concatenate([divergence, divergence[::-1]], axis=0)
+        mirrored = np.concatenate([mirrored, mirrored[:, ::-1]], axis=1)
+        pressure = np.fft.irfft2(
+            np.fft.rfft2(mirrored) * self.inverseEigen, s=mirrored.shape
+        )[: self.x, : self.y]
+        self.u[1:-1] -= (np.diff(pressure, axis=0) / self.dx).astype(np.float32)
+        self.v[:, 1:-1] -= (np.diff(pressure, axis=1) / self.dy).astype(np.float32)
+
+    def step(self, inflow: np.ndarray):
+        smoke = (self.advectSmoke() + inflow) * (1 - self.decay)
+        u, v = self.advectVelocity()
+        # Buoyancy pushes up on the faces between cells, by the smoke either side
+        v[:, 1:-1] += self.buoyancy * 0.5 * (smoke[:, :-1] + smoke[:, 1:])
+        self.smoke, self.u, self.v = smoke.astype(np.float32), u, v
+        self.project()
+
+    # Copies of the fields, everything needed to carry on from this step
+    def getState(self):
+        return {"smoke": self.smoke.copy(), "u": self.u.copy(), "v": self.v.copy()}
+
+    # Puts back fields from `getState`
+    def setState(self, state: dict):
+        self.smoke = np.array(state["smoke"], dtype=np.float32)
+        self.u = np.array(state["u"], dtype=np.float32)
+        self.v = np.array(state["v"], dtype=np.float32)
+
+    # Smoke density as a numpy array, indexed [y, x] from the bottom left
+    def density(self):
+        return self.smoke.T
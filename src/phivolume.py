@@ -0,0 +1,235 @@
+# phivolume.py
+# Lodinu Kalugalage
+#
+# Description: This file contains the phiflow smoke `Volume` and the phiflow backend it runs on.
+
+# Dependencies
+import numpy as np
+import phi.flow as pf
+
+import time  # Included with python
+
+import constants as c
+import stage as stg
+
+# Name of the phiflow backend in use, picked once for the whole process
+backendName = None
+compiledAdvance = None  # `advance` jit compiled, or False when it can't be
+
+
+# Makes the backend named by `SMOKE_BACKEND` phiflow's default, on the CPU,
+# falling back to NumPy when it isn't installed
+def useBackend():
+    global backendName
+    if backendName is not None:
+        return backendName
+
+    name = c.SMOKE_BACKEND
+    try:
+        if name == "jax":
+            from phi.jax import JAX as backend
+        elif name == "torch":
+            from phi.torch import TORCH as backend
+        else:
+            name = "numpy"
+            backend = pf.math.backend.NUMPY
+    except ImportError:
+        print("Smoke backend " + name + " is not installed, falling back to numpy")
+        name = "numpy"
+        backend = pf.math.backend.NUMPY
+    backend.set_default_device(backend.list_devices("CPU")[0])
+    pf.math.backend.set_global_default_backend(backend)
+    backendName = name
+    return name
+
+
+# One step of the simulation, kept outside of `Volume` so it can be jit compiled
+# The pressure from the last step is the starting guess for this step's pressure solve
+def advance(
+    smoke,
+    velocity,
+    inflow,
+    pressure,
+    timeStep: float,
+    decay: float,
+    solver: str,
+    tolerance: float,
+    maxIterations: int,
+):
+    # Complicated phsics stuff simplified with phiflow
+    # (its faster too)
+    smoke = pf.advect.mac_cormack(smoke, velocity, dt=timeStep) + inflow
+    smoke = smoke * (1 - decay)
+    buoyancy_force = (smoke * (0, 4)) @ (velocity)
+    velocity = (
+        pf.advect.semi_lagrangian(velocity, velocity, dt=timeStep) + buoyancy_force
+    )
+    # Running out of iterations keeps the best guess so far rather than failing the step
+    solve = pf.Solve(
+        solver,
+        tolerance,
+        tolerance,
+        pressure,
+        maxIterations,
+        suppress=[pf.math.NotConverged],
+    )
+    velocity, pressure = pf.fluid.make_incompressible(velocity, solve=solve)
+    return smoke, velocity, pressure
+
+
+# Gets `advance` jit compiled if `SMOKE_JIT` is on and the backend can compile it,
+# otherwise None so the step runs eagerly
+def getCompiledAdvance():
+    global compiledAdvance
+    if compiledAdvance is None and c.SMOKE_JIT:
+        if useBackend() == "numpy":
+            print("NumPy can't jit compile the smoke step, running it eagerly")
+            compiledAdvance = False
+        else:
+            compiledAdvance = pf.math.jit_compile(
+                advance, auxiliary_args="timeStep,decay,solver,tolerance,maxIterations"
+            )
+    return compiledAdvance or None
+
+
+# Volume class with phi
+class Volume:
+    stageInfo: stg.StageDescriptor  # Stage descriptor
+
+    resolution: float  # Grid cells per unit of stage
+    x: int
+    y: int
+
+    timeStep = 1.0
+    decay = 0.0
+
+    bound: pf.Box  # Boundary of the volume
+    smoke: pf.CenteredGrid  # Smoke density
+    # Staggered grid is a grid where the values are stored at the edges of the grid
+    # Which means it does moore neighbour interpolation
+    velocity: pf.StaggeredGrid  # Velocity field
+    pressure: pf.CenteredGrid  # Pressure from the last step, warm starts the next solve
+
+    # Pressure solve settings, these match phiflow's defaults
+    solver = "auto"  # Solver method, e.g. "CG", "biCG-stab" or "auto"
+    tolerance = 1e-5  # Relative and absolute tolerance
+    maxIterations = 1000  # Iterations before the solve gives up
+    lastIterations = None  # Iterations of the last uncompiled pressure solve
+
+    # Constructor for a `Volume`
+    def __init__(
+        self, stageInfo: stg.StageDescriptor, resolution=c.SMOKE_SIM_RESOLUTION
+    ):
+        # Grids are made on the default backend, so it has to be picked first
+        useBackend()
+        self.stageInfo = stageInfo
+        self.resolution = resolution
+        self.bound = pf.Box(x=stageInfo.width, y=stageInfo.height)
+        self.x, self.y = int(stageInfo.width * resolution), int(
+            stageInfo.height * resolution
+        )
+
+        self.smoke = pf.CenteredGrid(
+            0,
+            pf.extrapolation.BOUNDARY,
+            x=self.x,
+            y=self.y,
+            bounds=self.bound,
+        )
+        self.velocity = pf.StaggeredGrid(
+            0,
+            pf.extrapolation.ZERO,
+            x=self.x,
+            y=self.y,
+            bounds=self.bound,
+        )
+        # Same as the guess phiflow would start from without one
+        self.pressure = pf.CenteredGrid(
+            0,
+            pf.extrapolation.BOUNDARY,
+            x=self.x,
+            y=self.y,
+            bounds=self.bound,
+        )
+
+    # Sets up the pressure solve from the choreography's `pressure` block, e.g.
+    # {"solver": "CG", "tolerance": 1e-4, "maxIterations": 200}
+    def setSolve(self, solveDef: dict):
+        self.solver = solveDef.get("solver", self.solver)
+        self.tolerance = solveDef.get("tolerance", self.tolerance)
+        self.maxIterations = solveDef.get("maxIterations", self.maxIterations)
+
+    # Samples a sphere onto the grid, giving its values indexed [x, y]
+    def sampleSphere(self, position, radius: float):
+        return pf.CenteredGrid(
+            pf.Sphere(x=position[0], y=position[1], radius=radius),  # type: ignore
+            pf.extrapolation.BOUNDARY,
+            x=self.x,
+            y=self.y,
+            bounds=self.bound,
+        ).values.numpy("x,y")
+
+    # Wraps values indexed [x, y] into a grid that can be used as inflow
+    def makeInflow(self, values: np.ndarray):
+        return self.smoke.with_values(pf.math.tensor(values, pf.spatial("x,y")))
+
+    def step(self, inflow: pf.field.SampledField):
+        args = (
+            self.smoke,
+            self.velocity,
+            inflow,
+            self.pressure,
+            self.timeStep,
+            self.decay,
+            self.solver,
+            self.tolerance,
+            self.maxIterations,
+        )
+        compiled = getCompiledAdvance()
+        if compiled is None:
+            with pf.math.SolveTape() as solves:
+                result = advance(*args)
+            self.lastIterations = int(pf.math.max(solves[0].iterations))
+        else:
+            # The solve runs inside the compiled graph, so its iterations can't be seen
+            # A new trace means the step was (re)compiled during this call
+            traces = len(compiled.traces)  # type: ignore
+            start = time.perf_counter()
+            result = compiled(*args)
+            if len(compiled.traces) > traces:  # type: ignore
+                print(
+                    f"Traced and compiled the smoke step on {backendName} "
+                    f"in {time.perf_counter() - start:.2f}s"
+                )
+        self.smoke, self.velocity, self.pressure = result  # type: ignore
+
+    # Grids as numpy arrays indexed [x, y], everything needed to carry on from this step
+    def getState(self):
+        return {
+            "smoke": self.smoke.values.numpy("x,y"),
+            "velocityX": self.velocity.vector["x"].values.numpy("x,y"),
+            "velocityY": self.velocity.vector["y"].values.numpy("x,y"),
+            "pressure": self.pressure.values.numpy("x,y"),
+        }
+
+    # Puts back grids from `getState`
+    def setState(self, state: dict):
+        self.smoke = self.smoke.with_values(
+            pf.math.tensor(state["smoke"], pf.spatial("x,y"))
+        )
+        self.velocity = self.velocity.with_values(
+            pf.math.stack(
+                [
+                    pf.math.tensor(state["velocityX"], pf.spatial("x,y")),
+                    pf.math.tensor(state["velocityY"], pf.spatial("x,y")),
+                ],
+                pf.channel(vector="x,y"),
+            )
+        )
+        self.pressure = self.pressure.with_values(
+            pf.math.tensor(state["pressure"], pf.spatial("x,y"))
+        )
+
+    # Smoke density as a numpy array, indexed [y, x] from the bottom left
+    def density(self):
+        return np.sum(self.smoke.values.numpy("y,x,inflow_loc")[...], axis=2)
@@ -5,19 +5,24 @@
 
 # Dependencies
 import numpy as np
-from matplotlib import pyplot as plt
-from skimage.transform import resize
-from PIL import Image  # Included with matplotlib
 
-from typing import Tuple  # Included with python
+from typing import Tuple, TYPE_CHECKING  # Included with python
+from collections import OrderedDict  # Included with python
 
+import constants as c
 import util
 
+if TYPE_CHECKING:
+    from matplotlib import pyplot as plt
+
 
 class Prop:
     img: np.ndarray  # Image of the prop
     position: Tuple[float, float]  # Position of the prop
     scale: float  # Scale of the prop
+    artist = None  # Image artist, kept between frames
+    artistImg = None  # Scaled image the artist is currently showing
+    artistExtent = None  # Extent the artist is currently showing
 
     # Constructor for a `Prop`
     def __init__(self, img: np.ndarray, position: Tuple[float, float], scale: float):
@@ -25,28 +30,73 @@ class Prop:
         self.position = position
         self.scale = scale
 
-    # Draws the prop
-    def draw(self, ax: plt.Axes):
+    # Area of the stage the prop covers, [left, right, bottom, top]
+    def extent(self):
+        return [
+            self.position[0],
+            self.position[0] + self.img.shape[1] * self.scale,
+            self.position[1],
+            self.position[1] + self.img.shape[0] * self.scale,
+        ]
+
+    # Draws the prop, the image artist is made on the first draw and updated after that
+    # Gives back whether anything about it changed since it was last drawn
+    def draw(self, ax: "plt.Axes"):
+        scaledimg = getOrMakeScaled(self.img, self.scale)
+        extent = self.extent()
+        changed = True
+        if self.artist is None or self.artist.axes is not ax:
+            self.artist = ax.imshow(scaledimg, extent=extent)
+        else:
+            # Setting the data drops the artist's image cache, so only do it on a change
+            if self.artistImg is not scaledimg:
+                self.artist.set_data(scaledimg)
+            elif extent == self.artistExtent:
+                changed = False
+            if changed:
+                self.artist.set_extent(extent)
+        self.artistImg = scaledimg
+        self.artistExtent = extent
+        return changed
+
+    # Draws the prop into a `FrameCompositor`, which does its own nearest neighbour scaling
+    def composite(self, comp):
+        comp.blendImage(comp.side, comp.sideYs, self.img, self.extent())
+
+
+# Caching so that we don't have to rescale the sprite every frame, least recently used first
+storedSprites = OrderedDict()
+
+
+def getOrMakeScaled(img: np.ndarray, scale: float):
+    key = (id(img), scale)
+    if key in storedSprites:
+        storedSprites.move_to_end(key)
+        return storedSprites[key][1]
+
+    if float(scale).is_integer() and scale >= 1:
+        # Nearest neighbour at an integer scale is just repeating every pixel
+        scaledimg = np.repeat(np.repeat(img, int(scale), axis=0), int(scale), axis=1)
+    else:
+        # Imported here as scikit-image is slow to import and most scales don't need it
+        from skimage.transform import resize
+
         # https://scikit-image.org/docs/dev/api/skimage.transform.html#skimage.transform.resize
         scaledimg = resize(
-            self.img,
+            img,
             (
-                int(self.img.shape[0] * self.scale),
-                int(self.img.shape[1] * self.scale),
+                int(img.shape[0] * scale),
+                int(img.shape[1] * scale),
             ),
             order=0,  # nearest neighbour
         )
-        ax.imshow(
-            scaledimg,
-            extent=[
-                self.position[0],
-                self.position[0] + self.img.shape[1] * self.scale,
-                self.position[1],
-                self.position[1] + self.img.shape[0] * self.scale,
-            ],
-        )
+    # The source image is kept with the result so its id can't be reused while cached
+    storedSprites[key] = (img, scaledimg)
+    if len(storedSprites) > c.PROP_SPRITE_CACHE_SIZE:
+        storedSprites.popitem(last=False)
+    return scaledimg
 
 
 def propFromFile(name: str):
-    # Uses PIL to open the image, then converts it to a numpy array
-    return Prop(np.array(Image.open(util.getPath(name))), (0, 0), 1.0)
+    # Opens the image as a numpy array, each file is only decoded once
+    return Prop(util.loadImage(name), (0, 0), 1.0)
@@ -0,0 +1,200 @@
+# render.py
+# Lodinu Kalugalage
+#
+# Description: This file contains the frame loop, and a way of splitting a run into
+# contiguous slices of frames rendered by a pool of processes.
+
+# Dependencies
+from tqdm import tqdm  # Used to make a nice scrolling thing in the terminal
+
+import concurrent.futures  # Included with python
+import os  # Included with python
+
+import constants
+import director
+import scheduler as scheduling
+import tracing
+import writer
+
+
+# Renders output frames until `stop`, carrying on from wherever the scheduler is
+# A checkpoint is saved after every `checkpointEvery` frames, if it isn't 0
+# Frames and checkpoints go in folders inside `outputDir`
+def renderFrames(
+    scheduler: scheduling.Scheduler,
+    stop: int,
+    headless: bool,
+    progress=True,
+    checkpointEvery=constants.CHECKPOINT_INTERVAL,
+    outputDir=".",
+):
+    cacheDir = os.path.join(outputDir, "_simcache")
+    checkpointDir = os.path.join(outputDir, constants.CHECKPOINT_DIR)
+    if constants.CACHE_IMAGES:
+        os.makedirs(cacheDir, exist_ok=True)
+    if checkpointEvery:
+        os.makedirs(checkpointDir, exist_ok=True)
+
+    choreo = scheduler.choreo
+    # Headless frames are grabbed from the rendered canvas and saved by a pool of threads
+    # while the next one is made, the interactive view saves them from the figure
+    frameWriter = None
+    if headless and constants.CACHE_IMAGES:
+        frameWriter = writer.FrameWriter()
+        choreo.stage.prepareGrab()
+
+    bar = tqdm(range(scheduler.frame, stop), disable=not progress)
+    try:
+        for i in bar:
+            # Spans are numbered by the frame they help make
+            tracing.setFrame(i)
+            with tracing.span("frame"):
+                renderFrame(scheduler, i, headless, frameWriter, bar, cacheDir)
+                if checkpointEvery and scheduler.frame % checkpointEvery == 0:
+                    with tracing.span("checkpoint"):
+                        # Every frame before a checkpoint is saved before it is
+                        if frameWriter is not None:
+                            frameWriter.flush()
+                        scheduler.saveCheckpoint(
+                            os.path.join(checkpointDir, f"{scheduler.frame}.npz")
+                        )
+    finally:
+        if frameWriter is not None:
+            frameWriter.close()
+    if progress and frameWriter is not None and frameWriter.links:
+        print(
+            f"{frameWriter.links} of {frameWriter.frames} frames were repeats, "
+            "saved as links to an earlier frame"
+        )
+
+
+# Advances to output frame `i`, draws it and saves it, through `frameWriter` if there is one
+# Frames the writer knows are repeats aren't drawn
+def renderFrame(
+    scheduler: scheduling.Scheduler,
+    i: int,
+    headless: bool,
+    frameWriter: "writer.FrameWriter | None",
+    bar: tqdm,
+    cacheDir: str,
+):
+    choreo = scheduler.choreo
+    with tracing.span("advance"):
+        scheduler.advance()
+    # Shows how hard the pressure solves worked on this step
+    iterations = choreo.solverIterations()
+    if iterations:
+        bar.set_postfix(iterations, refresh=False)
+    name = os.path.join(cacheDir, f"{i}.png")
+    # A frame drawn from the same state as the last one, with no smoke moving, would
+    # look the same, so it's saved as a link to it without being drawn
+    state = None
+    if frameWriter is not None and frameWriter.dedupe:
+        state = choreo.frameState()
+        if frameWriter.isRepeat(state):
+            with tracing.span("repeat"):
+                frameWriter.repeat(name, i)
+            return
+    choreo.draw()
+    if not headless:
+        import matplotlib.pyplot as plt
+
+        with tracing.span("show"):
+            choreo.stage.show()
+            plt.draw()
+            plt.pause(constants.FRAME_PAUSE)
+    elif not constants.CACHE_IMAGES:
+        # Nothing else will rasterize the frame if it isn't being saved
+        with tracing.span("render"):
+            choreo.stage.render()
+    if constants.CACHE_IMAGES:
+        with tracing.span("snapshot"):
+            if frameWriter is None:
+                # A headless render may have left the frame as a link to another one,
+                # which saving over would change as well
+                if os.path.lexists(name):
+                    os.remove(name)
+                choreo.stage.snapshot(name)
+            else:
+                frameWriter.write(choreo.stage.grab(), name, i, state)
+    choreo.clean()
+
+
+# Path of the checkpoint furthest into the render, only counting ones made at or before
+# frame `before` if it's given, or None if there aren't any
+def latestCheckpoint(before=None):
+    if not os.path.isdir(constants.CHECKPOINT_DIR):
+        return None
+    frames = [
+        int(name[: -len(".npz")])
+        for name in os.listdir(constants.CHECKPOINT_DIR)
+        if name.endswith(".npz") and name[: -len(".npz")].isdigit()
+    ]
+    if before is not None:
+        frames = [frame for frame in frames if frame <= before]
+    if not frames:
+        return None
+    return os.path.join(constants.CHECKPOINT_DIR, f"{max(frames)}.npz")
+
+
+# Renders one slice of frames in a worker process
+# `rates` is the (tick, smoke, frame) rates given to the `Scheduler`
+# With `checkpointEvery`, the slice saves checkpoints and starts from the latest one
+# before it, so only the frames after that have to be simulated to reach it
+def renderShard(
+    choreoFile: str,
+    backend: str,
+    quality: str | None,
+    rates: tuple,
+    start: int,
+    stop: int,
+    checkpointEvery=0,
+):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    choreo = director.Choreography.loadFromFile(choreoFile, backend, quality)
+    choreo.parse()
+    scheduler = scheduling.Scheduler(choreo, *rates)
+    checkpoint = latestCheckpoint(start) if checkpointEvery else None
+    if checkpoint is not None:
+        scheduler.loadCheckpoint(checkpoint)
+    # Everything before the slice is simulated without being drawn
+    scheduler.fastForward(start)
+    renderFrames(
+        scheduler, stop, headless=True, progress=False, checkpointEvery=checkpointEvery
+    )
+    return stop - start
+
+
+# Splits frames `first` to `frames` into `shards` contiguous slices and renders them in
+# parallel, every worker fast forwards to its slice so frames match a serial run
+def renderSharded(
+    choreoFile: str,
+    backend: str,
+    quality: str | None,
+    rates: tuple,
+    frames: int,
+    shards: int,
+    first=0,
+    checkpointEvery=0,
+):
+    bounds = [first + (frames - first) * i // shards for i in range(shards + 1)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=shards) as pool:
+        futures = [
+            pool.submit(
+                renderShard,
+                choreoFile,
+                backend,
+                quality,
+                rates,
+                bounds[i],
+                bounds[i + 1],
+                checkpointEvery,
+            )
+            for i in range(shards)
+            if bounds[i] < bounds[i + 1]
+        ]
+        with tqdm(total=frames - first) as bar:
+            for future in concurrent.futures.as_completed(futures):
+                bar.update(future.result())
@@ -0,0 +1,98 @@
+# scheduler.py
+# Lodinu Kalugalage
+#
+# Description: This file contains the Scheduler class, which runs choreography ticks,
+# smoke steps and output frames at their own rates on a shared show clock.
+
+# Dependencies
+from fractions import Fraction  # Included with python
+
+import constants as c
+import director
+
+
+class Scheduler:
+    choreo: director.Choreography  # Choreography being scheduled
+    tickRate: Fraction  # Choreography ticks per second of show time
+    smokeRate: Fraction  # Smoke steps (`Volume.timeStep` each) per second of show time
+    frameRate: Fraction  # Output frames per second of show time
+    frame = 0  # Output frames produced so far
+    ticks = 0  # Choreography ticks run so far
+    substeps = 0  # Smoke steps run so far
+
+    # Constructor for a `Scheduler`, rates are kept as fractions so the clock never drifts
+    def __init__(
+        self,
+        choreo: director.Choreography,
+        tickRate=c.TICK_RATE,
+        smokeRate=c.SMOKE_RATE,
+        frameRate=c.FRAME_RATE,
+    ):
+        self.choreo = choreo
+        self.tickRate = Fraction(str(tickRate))
+        self.smokeRate = Fraction(str(smokeRate))
+        self.frameRate = Fraction(str(frameRate))
+
+    # Runs every tick and smoke step due before the next output frame
+    # Events happen at multiples of 1 / rate, a smoke step goes before a tick at the
+    # same time, so with equal rates this is exactly `Choreography.step` once per frame
+    def advance(self):
+        self.frame += 1
+        now = self.frame / self.frameRate
+        ticksDue = int(now * self.tickRate)
+        substepsDue = int(now * self.smokeRate)
+        while self.ticks < ticksDue or self.substeps < substepsDue:
+            nextTick = (self.ticks + 1) / self.tickRate
+            nextSubstep = (self.substeps + 1) / self.smokeRate
+            if self.substeps < substepsDue and (
+                self.ticks >= ticksDue or nextSubstep <= nextTick
+            ):
+                self.choreo.stepSmoke()
+                self.substeps += 1
+            else:
+                self.choreo.tick()
+                self.ticks += 1
+
+    # Saves a checkpoint that `loadCheckpoint` can carry on from
+    def saveCheckpoint(self, filename: str):
+        self.choreo.saveCheckpoint(
+            filename,
+            {
+                "frame": self.frame,
+                "ticks": self.ticks,
+                "substeps": self.substeps,
+                "rates": f"{self.tickRate} {self.smokeRate} {self.frameRate}",
+            },
+        )
+
+    # Carries on from a checkpoint, which has to have been made at the same rates
+    def loadCheckpoint(self, filename: str):
+        cursor = self.choreo.loadCheckpoint(filename)
+        if cursor["rates"] != f"{self.tickRate} {self.smokeRate} {self.frameRate}":
+            raise ValueError(
+                "Checkpoint was made at different rates: " + cursor["rates"]
+            )
+        self.frame = cursor["frame"]
+        self.ticks = cursor["ticks"]
+        self.substeps = cursor["substeps"]
+
+    # Jumps straight to just after `frame` output frames, the choreography's state is
+    # looked up on its timeline, so this works backwards too, for scrubbing through a show
+    # Smoke has to be simulated step by step, so this can't be used with smoke volumes
+    def seek(self, frame: int):
+        if self.choreo.objectBins["smokeMachineVolumes"]:
+            raise ValueError(
+                "Can't seek a choreography with smoke, it has to be simulated"
+            )
+        now = Fraction(frame) / self.frameRate
+        self.frame = frame
+        self.ticks = int(now * self.tickRate)
+        self.substeps = int(now * self.smokeRate)
+        self.choreo.seek(self.ticks)
+
+    # Runs the simulation up to `frame` without drawing anything
+    # Every tick is replayed rather than seeked, so the frames after it are exactly the
+    # same as an unbroken run's, ticks without smoke are quick to run
+    def fastForward(self, frame: int):
+        while self.frame < frame:
+            self.advance()
@@ -5,14 +5,17 @@
 
 # dependencies
 import numpy as np
-from matplotlib import pyplot as plt
-import phi.flow as pf
 
-from typing import Tuple  # Included with python
+import importlib  # Included with python
+from typing import Tuple, TYPE_CHECKING  # Included with python
 
 import colour as col
 import constants as c
 import stage as stg
+import tracing
+
+if TYPE_CHECKING:
+    from matplotlib import pyplot as plt
 
 
 # A definition for a smoke machine
@@ -27,109 +30,140 @@ class SmokeMachine:
         self.intensity = intensity
 
 
-# Volume class with phi
-class Volume:
-    stageInfo: stg.StageDescriptor  # Stage descriptor
-
-    x: int
-    y: int
+# Fluid solvers a volume can run on, with the module and class they're made from
+# Each engine is only imported once it's used, so phiflow isn't needed for NumPy smoke
+smokeEngines = {
+    "phiflow": ["phivolume", "Volume"],
+    "numpy": ["numpyvolume", "NumpyVolume"],
+}
 
-    timeStep = 1.0
-    decay = 0.0
 
-    bound: pf.Box  # Boundary of the volume
-    smoke: pf.CenteredGrid  # Smoke density
-    # Staggered grid is a grid where the values are stored at the edges of the grid
-    # Which means it does moore neighbour interpolation
-    velocity: pf.StaggeredGrid  # Velocity field
-
-    # Constructor for a `Volume`
-    def __init__(self, stageInfo: stg.StageDescriptor):
-        self.stageInfo = stageInfo
-        self.bound = pf.Box(x=stageInfo.width, y=stageInfo.height)
-        self.x, self.y = int(stageInfo.width * c.SMOKE_SIM_RESOLUTION), int(
-            stageInfo.height * c.SMOKE_SIM_RESOLUTION
-        )
+# Gets the volume class of `engine`, importing it if it hasn't been already
+def getEngine(engine: str):
+    if engine not in smokeEngines:
+        raise ValueError("Unknown smoke engine: " + str(engine))
+    moduleName, className = smokeEngines[engine]
+    return getattr(importlib.import_module(moduleName), className)
 
-        self.smoke = pf.CenteredGrid(
-            0,
-            pf.extrapolation.BOUNDARY,
-            x=self.x,
-            y=self.y,
-            bounds=self.bound,
-        )
-        self.velocity = pf.StaggeredGrid(
-            0,
-            pf.extrapolation.ZERO,
-            x=self.x,
-            y=self.y,
-            bounds=self.bound,
-        )
 
-    def step(self, inflow: pf.field.SampledField):
-        # Complicated phsics stuff simplified with phiflow
-        # (its faster too)
-        smoke = (
-            pf.advect.mac_cormack(self.smoke, self.velocity, dt=self.timeStep) + inflow
-        )
-        smoke = smoke * (1 - self.decay)
-        buoyancy_force = (smoke * (0, 4)) @ (self.velocity)
-        velocity = (
-            pf.advect.semi_lagrangian(self.velocity, self.velocity, dt=self.timeStep)
-            + buoyancy_force
-        )
-        velocity, _ = pf.fluid.make_incompressible(velocity)
-        self.smoke, self.velocity = smoke, velocity  # type: ignore
+# Makes the fluid volume for `engine`, "phiflow" or "numpy"
+def makeVolume(stageInfo: stg.StageDescriptor, resolution: float, engine: str):
+    return getEngine(engine)(stageInfo, resolution)
 
 
 # SmokeMachine Volume
 class SmokeMachineVolume:
     stageInfo: stg.StageDescriptor
-    volume: Volume  # Volume object
+    volume = (
+        None  # `phivolume.Volume` or `numpyvolume.NumpyVolume` doing the simulation
+    )
     machines = []  # List of SmokeMachine objects
     smokeColour: Tuple[float, float, float] = (1, 1, 1)
+    artist = None  # Image artist for the smoke, kept between frames
+    inflowMasks: np.ndarray  # Unit intensity inflow of every machine, [machine, x, y]
+    inflowPositions: list  # Position each machine's inflow was sampled at
 
     # Constructor for a `SmokeMachineVolume`
-    def __init__(self, stageInfo, col: Tuple[float, float, float] = (1, 1, 1)):
+    def __init__(
+        self,
+        stageInfo,
+        col: Tuple[float, float, float] = (1, 1, 1),
+        resolution=c.SMOKE_SIM_RESOLUTION,
+        engine=c.SMOKE_ENGINE,
+    ):
         self.stageInfo = stageInfo
-        self.volume = Volume(stageInfo)
+        self.volume = makeVolume(stageInfo, resolution, engine)
         self.smokeColour = col
+        self.machines = []
+        self.inflowPositions = []
 
     # Adds a `SmokeMachine` to the volume
     def addMachine(self, machine: SmokeMachine):
         self.machines.append(machine)
 
+    # Resamples the inflow of any machine that moved since the last step
+    def updateInflowMasks(self):
+        if len(self.inflowPositions) != len(self.machines):
+            self.inflowMasks = np.zeros(
+                (len(self.machines), self.volume.x, self.volume.y), dtype=np.float32
+            )
+            self.inflowPositions = [None] * len(self.machines)
+        for i, machine in enumerate(self.machines):
+            position = (machine.position[0], machine.position[1])
+            if self.inflowPositions[i] != position:
+                self.inflowMasks[i] = self.volume.sampleSphere(
+                    position, c.SMOKE_MACHINE_RADIUS
+                )
+                self.inflowPositions[i] = position
+
     # Step simulation
     def step(self):
-        # Objects
-        inflow = None
-        for machine in self.machines:
-            # Add to list
-            addTo = (machine.intensity / 11) * pf.CenteredGrid(
-                pf.Sphere(x=machine.position[0], y=machine.position[1], radius=c.SMOKE_MACHINE_RADIUS),  # type: ignore
-                pf.extrapolation.BOUNDARY,
-                x=self.volume.x,
-                y=self.volume.y,
-                bounds=self.volume.bound,
+        with tracing.span("smoke.inflow"):
+            self.updateInflowMasks()
+            # The inflow is every machine's mask weighted by its intensity
+            weights = np.array(
+                [machine.intensity / 11 for machine in self.machines],
+                dtype=np.float32,
             )
-            if inflow == None:
-                inflow = addTo
-            else:
-                inflow += addTo
-        # Create inflow
-        self.volume.step(inflow)  # type: ignore
-        pass
-
-    # Draws the volume
-    def draw(self, ax: plt.Axes):
-        vals = np.sum(self.volume.smoke.values.numpy("y,x,inflow_loc")[...], axis=2)
-        cmap = col.getOrMakeCMAP(
-            (*self.smokeColour, 0), (*self.smokeColour, 1), "smokeTransparency"
+            inflow = np.tensordot(weights, self.inflowMasks, axes=1)
+            inflow = self.volume.makeInflow(inflow)
+        with tracing.span("smoke.solve"):
+            self.volume.step(inflow)
+
+    # Smoke density as a numpy array, indexed [y, x] from the bottom left
+    def density(self):
+        return self.volume.density()
+
+    # Whether there's smoke in the volume, or a machine making more, either can change
+    # how the next frame looks
+    def isActive(self):
+        if any(machine.intensity > 0 for machine in self.machines):
+            return True
+        return bool(np.any(self.density()))
+
+    # Smoke density for drawing, a coarse simulation is scaled up to the display
+    # resolution so drafts are drawn as smoothly as a final render
+    def displayDensity(self):
+        vals = self.density()
+        shape = (
+            int(self.stageInfo.height * c.SMOKE_DISPLAY_RESOLUTION),
+            int(self.stageInfo.width * c.SMOKE_DISPLAY_RESOLUTION),
+        )
+        if vals.shape[0] >= shape[0] and vals.shape[1] >= shape[1]:
+            return vals
+        from skimage.transform import resize
+
+        # Clipped so overshoot from the interpolation doesn't change the colour range
+        return np.clip(
+            resize(vals, shape, order=3, mode="edge"), vals.min(), vals.max()
         )
-        ax.imshow(
-            vals,
-            cmap=cmap,
-            interpolation="bicubic",
-            origin="lower",
-            extent=[0, self.stageInfo.width, 0, self.stageInfo.height],
+
+    # Colour map from clear to the smoke's colour
+    # It's cached by colour, so volumes (or batch jobs) with different colours don't mix
+    def getCMAP(self):
+        return col.getOrMakeCMAP(
+            (*self.smokeColour, 0),
+            (*self.smokeColour, 1),
+            "smoke_" + "_".join(str(v) for v in self.smokeColour),
         )
+
+    # Draws the volume, the image artist is made on the first draw and updated after that
+    def draw(self, ax: "plt.Axes"):
+        vals = self.displayDensity()
+        cmap = self.getCMAP()
+        if self.artist is None or self.artist.axes is not ax:
+            self.artist = ax.imshow(
+                vals,
+                cmap=cmap,
+                interpolation="bicubic",
+                origin="lower",
+                extent=[0, self.stageInfo.width, 0, self.stageInfo.height],
+            )
+        else:
+            self.artist.set_data(vals)
+            # A new imshow would scale the colours to this frame's density
+            self.artist.autoscale()
+
+    # Draws the volume into a `FrameCompositor`
+    def composite(self, comp):
+        comp.blendDensity(self.density(), self.getCMAP())
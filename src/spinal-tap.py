@@ -1,41 +1,166 @@
-# Dependencies on matplotlib
-import matplotlib.pyplot as plt
+import time  # Included with python
 
-from tqdm import tqdm  # Used to make a nice scrolling thing in the terminal
+# Taken before anything else is imported, so the startup report includes the imports
+startupStart = time.perf_counter()
 
-import sys  # Included with python
 import os  # Included with python
+import sys  # Included with python
 
 import constants
 import director
+import render
+import scheduler
+import tracing
 import util
 
+# Heavy dependencies named in the startup report when something has imported them
+HEAVY_MODULES = ["matplotlib", "matplotlib.pyplot", "skimage.transform", "phi"]
+
+
+# Prints how long each part of starting up took, and which heavy dependencies it needed
+def printStartupReport(timings: dict):
+    print("Startup:")
+    for name, seconds in timings.items():
+        print(f"    {name:<8}{seconds:.3f}s")
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    print("    loaded  " + (", ".join(loaded) if loaded else "nothing heavy"))
+
 
 def main():
+    # Positional arguments are the choreography file and the number of frames,
+    # options like `--headless` can be given anywhere
+    args, flags = util.parseArgs(sys.argv[1:])
+    timings = {"imports": time.perf_counter() - startupStart}
+
+    # Headless mode renders on a non-interactive backend, so there's no window,
+    # no event loop to pump and no pause between frames
+    headless = "headless" in flags
+    if headless:
+        # Picking the backend before pyplot is imported means it never loads a GUI
+        import matplotlib
+
+        matplotlib.use("Agg")
+
     # Loading the information from assets/
     choreoFile = (
-        "../assets/choreo/one.json"
-        if not len(sys.argv) > 1 or sys.argv[1] == "_"
-        else sys.argv[1]
+        "../assets/choreo/one.json" if not len(args) > 0 or args[0] == "_" else args[0]
     )
-    choreo = director.Choreography.loadFromFile(util.getPath(choreoFile))
-    choreo.parse()
-    plt.suptitle("STAGE VIEW", fontsize="18")
+    # `--backend=numpy` composites frames into a buffer instead of drawing with matplotlib
+    backend = flags.get("backend", "matplotlib")
+    # `--quality=draft|preview|final` sets the resolution (and engine) of every smoke volume
+    quality = flags.get("quality")
 
-    if constants.CACHE_IMAGES:
-        os.makedirs("_simcache", exist_ok=True)
+    # `--validate` only loads the choreography and builds its objects, then stops
+    if "validate" in flags:
+        start = time.perf_counter()
+        choreo = director.Choreography.loadFromFile(
+            util.getPath(choreoFile), backend, quality
+        )
+        timings["load"] = time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            choreo.parseObjects()
+        except ValueError as e:
+            print(f"{choreoFile} is invalid: {e}")
+            sys.exit(1)
+        timings["parse"] = time.perf_counter() - start
+        counts = ", ".join(
+            f"{len(objects)} {name}" for name, objects in choreo.objectBins.items()
+        )
+        print(f"{choreoFile} is valid: {counts}, {len(choreo.steps)} steps")
+        if "timings" in flags:
+            printStartupReport(timings)
+        return
+
+    # `--tick-rate`, `--smoke-rate` and `--fps` set how often the choreography ticks,
+    # the smoke steps and frames are output, per second of show time
+    rates = (
+        float(flags.get("tick-rate", constants.TICK_RATE)),
+        float(flags.get("smoke-rate", constants.SMOKE_RATE)),
+        float(flags.get("fps", constants.FRAME_RATE)),
+    )
 
     # Accepting a command line argument for the number of simulations to run or default to 100
-    simCount = 100 if not len(sys.argv) > 2 else int(sys.argv[2])
-    for i in tqdm(range(simCount)):
-        choreo.step()
-        choreo.draw()
-        plt.draw()
-        plt.pause(0.1)
-        if constants.CACHE_IMAGES:
-            name = f"_simcache/{i}.png"
-            choreo.stage.snapshot(name)
-        choreo.clean()
+    simCount = 100 if not len(args) > 1 else int(args[1])
+    # `--start=N` begins at frame N, the frames before it are simulated without being drawn
+    firstFrame = int(flags.get("start", 0))
+    rendered = max(simCount - firstFrame, 0)
+    start = time.perf_counter()
+
+    # `--batch=FILE` renders every job in a batch file, see batch.py, on `--workers`
+    # processes, into folders in `--out`
+    if "batch" in flags:
+        import batch
+
+        batch.runBatch(
+            flags["batch"],
+            {
+                "frames": simCount,
+                "backend": backend,
+                "quality": quality,
+                "rates": rates,
+            },
+            int(flags.get("workers", os.cpu_count() or 1)),
+            flags.get("out", "_batch"),
+        )
+        return
+
+    # `--checkpoint-every=K` saves a checkpoint after every K frames
+    checkpointEvery = int(flags.get("checkpoint-every", constants.CHECKPOINT_INTERVAL))
+
+    # `--shards=N` splits the frames across N processes, which always run headless,
+    # each starting from the latest checkpoint before its frames when there are any
+    shards = int(flags.get("shards", 1))
+    if shards > 1:
+        render.renderSharded(
+            util.getPath(choreoFile),
+            backend,
+            quality,
+            rates,
+            simCount,
+            shards,
+            firstFrame,
+            checkpointEvery,
+        )
+    else:
+        choreo = director.Choreography.loadFromFile(
+            util.getPath(choreoFile), backend, quality
+        )
+        timings["load"] = time.perf_counter() - start
+        choreo.parse()
+        timings["parse"] = time.perf_counter() - start - timings["load"]
+        # `--timings` reports the startup before any frames are rendered
+        if "timings" in flags:
+            printStartupReport(timings)
+        sched = scheduler.Scheduler(choreo, *rates)
+        # `--resume` carries on from the latest checkpoint, or `--resume=FILE` from FILE
+        resume = flags.get("resume")
+        if resume is True:
+            resume = render.latestCheckpoint()
+            if resume is None:
+                print("No checkpoints to resume from, starting from the beginning")
+        if resume:
+            sched.loadCheckpoint(resume)
+            print(f"Resuming from frame {sched.frame}")
+        sched.fastForward(firstFrame)
+        rendered = max(simCount - sched.frame, 0)
+        # `--trace=FILE` records how long every part of every frame took,
+        # `--trace-memory` adds how much memory each part allocated
+        traceFile = flags.get("trace")
+        if traceFile:
+            tracing.start(memory="trace-memory" in flags)
+        render.renderFrames(sched, simCount, headless, checkpointEvery=checkpointEvery)
+        if traceFile:
+            tracer = tracing.stop()
+            tracer.saveChromeTrace(traceFile)
+            summaryFile = os.path.splitext(traceFile)[0] + ".jsonl"
+            tracer.saveSummary(summaryFile)
+            print(f"Saved a trace to {traceFile} and a summary to {summaryFile}")
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Rendered {rendered} frames in {elapsed:.2f}s ({rendered / elapsed:.2f} fps)"
+    )
 
 
 if __name__ == "__main__":
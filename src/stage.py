@@ -4,14 +4,18 @@
 # Description: This file contains the Stage related class which is used to represent
 # the stage in the scene.
 
-import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image  # Included with matplotlib
+
+from typing import TYPE_CHECKING  # Included with python
 
 import constants as c
 import colour as col
 import util
 
+# pyplot is slow to import, so it waits until a `StageDraw` is made
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
 
 class StageDescriptor:
     width = 0  # Width of the stage
@@ -32,27 +36,38 @@ class StageDescriptor:
     def addBackdropFromFile(self, name: str):
         self.backdrop = "file://" + name
         self.isFile = True
-        self.source = np.array(Image.open(util.getPath(name)))
+        self.source = util.loadImage(name)
 
 
 def stageFromFile(name: str):
-    # Uses PIL to open the image, then converts it to a numpy array
-    return StageDescriptor(0, 0, np.array(Image.open(util.getPath(name))))
-
-
-defaultStageCMAP = col.getOrMakeCMAP("black", "black")
+    # Opens the image as a numpy array, each file is only decoded once
+    return StageDescriptor(0, 0, util.loadImage(name))
 
 
 class StageDraw:
-    topAx: plt.Axes  # Top down axis
-    sideAx: plt.Axes  # Side on axis
+    topAx: "plt.Axes"  # Top down axis
+    sideAx: "plt.Axes"  # Side on axis
     descriptor: StageDescriptor  # Stage descriptor
+    backdropDrawn = False  # Whether the backdrop artists have been created
+    # The static layers (backdrop, topdown strip and props) are rendered once and kept,
+    # every frame starts from them and only draws the smoke and lights on top
+    staticArtists = None  # Artists in the cached background, None until `beginDynamic`
+    background = (
+        None  # Cached render of the static layers, None when it has to be redone
+    )
+    backgroundSize = None  # Canvas size the background was rendered at
+    lastDynamic: set  # Artists of the dynamic layers in the last render
+    grabBox = None  # Rows and columns of the canvas that `grab` keeps
 
     # Constructor for a `StageDraw`
     def __init__(self, descriptor):
+        import matplotlib.pyplot as plt
+
         self.descriptor = descriptor
+        self.lastDynamic = set()
 
         self.fig = plt.figure(constrained_layout=True)
+        self.fig.suptitle("STAGE VIEW", fontsize="18")
         gs = self.fig.add_gridspec(
             ncols=1,
             nrows=2,
@@ -68,17 +83,27 @@ class StageDraw:
         # Done to keep the audience view the same
         _ = self.topAx.imshow(
             [[[0]]],
-            cmap=defaultStageCMAP,
+            cmap=col.getOrMakeCMAP("black", "black"),
             extent=[0, descriptor.width, 0, c.LIGHT_SOURCE_DIAMETER],
             interpolation="nearest",
             alpha=1,
             origin="lower",
         ).set_zorder(-1)
 
-    # Draws the stage's backdrop
+        # Artists are updated in place rather than re-added every frame, so the view
+        # is pinned to the stage instead of following the extent of the last image
+        self.topAx.set_xlim(0, descriptor.width)
+        self.topAx.set_ylim(0, c.LIGHT_SOURCE_DIAMETER)
+        self.sideAx.set_xlim(0, descriptor.width)
+        self.sideAx.set_ylim(0, descriptor.height)
+        self.topAx.set_autoscale_on(False)
+        self.sideAx.set_autoscale_on(False)
+
+    # Draws the stage's backdrop, the backdrop never changes so it's only added once
     def draw(self):
-        if self.descriptor.backdrop is None:
+        if self.descriptor.backdrop is None or self.backdropDrawn:
             return
+        self.backdropDrawn = True
         # Draws the backdrop
         if self.descriptor.isFile and self.descriptor.source is not None:
             self.sideAx.imshow(
@@ -134,9 +159,116 @@ class StageDraw:
         self.topAx.set_axis_on()
         self.sideAx.set_axis_on()
 
+    # Everything added to the axes from here on is a dynamic layer, redrawn every frame,
+    # everything already in them is static and kept in the cached background
+    def beginDynamic(self):
+        artists = set(self.topAx.get_children()) | set(self.sideAx.get_children())
+        if self.staticArtists is None or not artists <= (
+            self.staticArtists | self.lastDynamic
+        ):
+            # Something static was added since the last frame
+            self.staticArtists = artists - self.lastDynamic
+            self.invalidate()
+
+    # Artists of the dynamic layers, in the order their axes draw them, along with any
+    # static ones drawn after them (like the axis lines) so they still end up on top
+    def dynamicArtists(self):
+        if self.staticArtists is None:
+            return []
+        dynamic = []
+        for ax in [self.topAx, self.sideAx]:
+            # Same order as `Axes.draw`, its background patch always goes first
+            artists = [artist for artist in ax.get_children() if artist is not ax.patch]
+            if not ax.axison:
+                hidden = {ax.xaxis, ax.yaxis, *ax.spines.values()}
+                artists = [a for a in artists if a not in hidden]
+            artists.sort(key=lambda artist: artist.get_zorder())
+            for i, artist in enumerate(artists):
+                if artist not in self.staticArtists:
+                    dynamic += artists[i:]
+                    break
+        return dynamic
+
+    # Throws away the cached background, used when something static changes
+    def invalidate(self):
+        self.background = None
+
+    # Sets the figure up for frames to be grabbed from its canvas, laid out like a
+    # snapshot at `dpi` with the axes hidden, every grabbed frame is then the same size
+    def prepareGrab(self, dpi=c.SNAPSHOT_DPI):
+        self.topAx.set_axis_off()
+        self.sideAx.set_axis_off()
+        self.topAx.set_xlim(0, self.descriptor.width)
+        self.topAx.set_ylim(0, c.LIGHT_SOURCE_DIAMETER)
+        self.sideAx.set_xlim(0, self.descriptor.width)
+        self.sideAx.set_ylim(0, self.descriptor.height)
+        self.fig.set_dpi(dpi)
+        self.grabBox = None
+        self.invalidate()
+
+    # Renders the frame and copies it out of the canvas as an RGBA array, cropped to the
+    # figure's contents like a snapshot
+    def grab(self):
+        self.render()
+        buffer = np.asarray(self.fig.canvas.buffer_rgba())
+        if self.grabBox is None:
+            # The layout doesn't change, so the crop is only worked out once
+            # and it's the same size as `snapshot` would save
+            bbox = self.fig.get_tightbbox(self.fig.canvas.get_renderer())
+            dpi = self.fig.dpi
+            top = max(round(buffer.shape[0] - bbox.y1 * dpi), 0)
+            left = max(round(bbox.x0 * dpi), 0)
+            self.grabBox = (
+                slice(top, top + int(bbox.height * dpi)),
+                slice(left, left + int(bbox.width * dpi)),
+            )
+        return buffer[self.grabBox].copy()
+
+    # Rasterizes the figure without showing it, used when running headless
+    # The background is restored from the cache when it's still good, and the dynamic
+    # layers are drawn over it
+    def render(self):
+        from matplotlib.image import AxesImage
+
+        canvas = self.fig.canvas
+        dynamic = self.dynamicArtists()
+        self.lastDynamic = set(dynamic) - self.staticArtists
+        size = canvas.get_width_height()
+        if self.background is None or self.backgroundSize != size:
+            # The dynamic layers are left out while the static ones are rendered
+            # Animated artists are skipped without changing the layout, like hiding the
+            # axis lines would, but images are drawn anyway so they're hidden instead
+            images = [
+                a for a in dynamic if isinstance(a, AxesImage) and a.get_visible()
+            ]
+            for artist in dynamic:
+                artist.set_animated(True)
+            for artist in images:
+                artist.set_visible(False)
+            canvas.draw()
+            for artist in dynamic:
+                artist.set_animated(False)
+            for artist in images:
+                artist.set_visible(True)
+            self.background = canvas.copy_from_bbox(self.fig.bbox)
+            self.backgroundSize = size
+        else:
+            canvas.restore_region(self.background)
+        for artist in dynamic:
+            artist.axes.draw_artist(artist)
+
+    # The figure is already the stage view, there's nothing extra to show
+    def show(self):
+        pass
+
     # Clears the stage
+    # Artists are created once and updated in place by the objects that own them,
+    # so there's nothing to throw away between frames
     def clean(self):
-        self.topAx.patches.clear()
-        self.topAx.images.clear()
-        self.sideAx.patches.clear()
-        self.sideAx.images.clear()
+        pass
+
+    # Closes the figure, once the stage won't be drawn again
+    def close(self):
+        import matplotlib.pyplot as plt
+
+        plt.close(self.fig)
@@ -0,0 +1,68 @@
+# test_timeline.py
+# Lodinu Kalugalage
+#
+# Description: This file checks that seeking a choreography lands on exactly the state
+# that ticking up to the same point does, run with `python -m pytest` from `src/`.
+
+# Dependencies
+import json  # Included with python
+import random  # Included with python
+
+import benchmark
+import director
+
+
+# Everything seeking sets, compared by `repr` so floats have to match to the last bit
+def getState(choreo: director.Choreography):
+    values = [repr(v) for v in choreo.timeline.record()]
+    return values + [choreo.stepFrame, choreo.buffering]
+
+
+# Checks seeking to every tick up to `ticks` in a random order against ticking there,
+# then that ticking on from a seek carries on the same
+def checkSeek(choreoJson: dict, ticks: int):
+    choreo = director.Choreography(json.dumps(choreoJson))
+    choreo.parseObjects()
+    ticked = [getState(choreo)]
+    for _ in range(ticks):
+        choreo.tick()
+        ticked.append(getState(choreo))
+
+    order = list(range(ticks + 1))
+    random.Random(0).shuffle(order)
+    for tick in order:
+        choreo.seek(tick)
+        assert getState(choreo) == ticked[tick], f"seeking to tick {tick}"
+
+    choreo.seek(ticks // 3)
+    for tick in range(ticks // 3 + 1, ticks + 1):
+        choreo.tick()
+        assert getState(choreo) == ticked[tick], f"ticking on to tick {tick}"
+
+
+def testWholeSteps():
+    checkSeek(benchmark.makeScene(3, 2, 2, 0, 1, "numpy"), 200)
+
+
+# Floats add up differently depending on the order they're added in, so these have to be
+# replayed the same way ticks run them
+def testFloatSteps():
+    choreoJson = benchmark.makeScene(2, 1, 1, 0, 1, "numpy")
+    choreoJson["steps"] = [
+        [
+            ["light", "light_0", "position", "add", 0.1],
+            ["light", "light_1", "intensity", "add", 0.3],
+            ["prop", "prop_0", "scale", "add", 0.1],
+        ],
+        [
+            ["light", "light_1", "intensity", "set", 1.7],
+            ["buffer", 2],
+            ["light", "light_0", "position", "add", 0.2],
+        ],
+        [
+            ["light", "light_0", "direction", "sub", 0.7],
+            ["prop", "prop_0", "position", "add", [0.25, -0.1]],
+        ],
+        [["lightgroup", "group_0", "intensity", 2], ["buffer", 0]],
+    ]
+    checkSeek(choreoJson, 600)
@@ -0,0 +1,247 @@
+# timeline.py
+# Lodinu Kalugalage
+#
+# Description: This file contains the Timeline class, an index of the state of every light,
+# prop and smoke machine through a choreography, so any tick can be jumped to without
+# replaying the ones before it.
+#
+# Every step either sets an attribute or adds to it, so what the steps of a loop have done
+# to an attribute by any point is one of those too, an "effect" of (adds, value). Only the
+# steps where an attribute's effect changes are kept, and the effect at any step is found
+# with a bisect, so the index grows with the changes steps make rather than with every
+# step times every object.
+#
+# Adding floats gives different results depending on the order they're added in, so
+# effects are only used for attributes where every value is a whole number, which add up
+# exactly. Any other attribute keeps the operations of a loop and replays them in order
+# from the start of the loop, the same as `Choreography.tick` does.
+
+# Dependencies
+from array import array  # Included with python
+from bisect import bisect_right  # Included with python
+
+import numpy as np
+
+# Attributes that steps can change, for every bin of objects they're in
+timelineAttributes = {
+    "lights": ["colour", "position", "direction", "intensity", "spread"],
+    "props": ["position", "scale"],
+    "smokeMachines": ["position", "intensity"],
+}
+
+
+# Moves a value on by `times` lots of a `change`
+def addDifference(value, change, times: int):
+    if change is None:
+        return value
+    if isinstance(value, (tuple, list)):
+        return tuple(v + c * times for v, c in zip(value, change))
+    return value + change * times
+
+
+# What an attribute ends up as after an `effect`, the effect applied `times` over
+def applyEffect(value, effect, times=1):
+    if effect is None:
+        return value
+    adds, change = effect
+    if adds:
+        return addDifference(value, change, times)
+    return change
+
+
+# The effect of `effect` followed by setting, or adding to, an attribute with `value`
+def composeEffect(effect, adds: bool, value):
+    if not adds or effect is None:
+        return (adds, value)
+    return (effect[0], addDifference(effect[1], value, 1))
+
+
+# Whether a number, or every number of a position, is whole
+# Whole numbers add up to the same thing in any order (while they're below 2**53)
+def isWhole(value):
+    if isinstance(value, (tuple, list)):
+        return all(isWhole(v) for v in value)
+    if isinstance(value, float):
+        return value.is_integer()
+    return isinstance(value, int)
+
+
+class Timeline:
+    choreo = None  # `Choreography` the timeline was built from
+    targets: list  # (object, attribute) for every value the timeline keeps
+    targetIndex: dict  # Index in `targets` of every (id(object), attribute)
+    initial: list  # Values before the first tick
+    effects: list  # Effect of a whole loop on every target, None if it's untouched
+    changeSteps: list  # For every target, the steps of a loop its effect changes after
+    changes: list  # For every target, its effect after each of `changeSteps`
+    operationSteps: list  # For every target, the step of each operation on it in a loop
+    operations: (
+        list  # For every target, (adds, value) of the operations, None once indexed
+    )
+    loopStarts: (
+        dict  # Values replayed targets start each loop with, worked out as needed
+    )
+    steps = 0  # Steps in a loop
+    bufferValues: dict  # `buffering` set by every step that has a `buffer`
+    startBuffering: int  # `buffering` before the first tick
+    applyTicks: np.ndarray  # Tick each step of the first loop runs on, counting from 1
+    offsets: np.ndarray  # Ticks from the first step to each step of a loop
+    period: int  # Ticks in one loop of the steps, including `buffer` pauses
+    bufferingAfter: np.ndarray  # `buffering` after each step, [loop 0 or later][step]
+
+    # Constructor for a `Timeline`, from the choreography's objects before any steps run
+    # Steps are added in order with `addStep`, then it's `finish`ed
+    def __init__(self, choreo):
+        self.choreo = choreo
+        self.targets = [
+            (obj, attribute)
+            for binName, attributes in timelineAttributes.items()
+            for obj in choreo.objectBins[binName].values()
+            for attribute in attributes
+        ]
+        self.targetIndex = {
+            (id(obj), attribute): i for i, (obj, attribute) in enumerate(self.targets)
+        }
+        self.initial = self.record()
+        self.operationSteps = [array("q") for _ in self.targets]
+        self.operations = [[] for _ in self.targets]
+        self.loopStarts = {}
+        self.bufferValues = {}
+        self.startBuffering = choreo.buffering
+
+    # Follows the next step of the loop through what its `operations` change, in the
+    # order they run
+    def addStep(self, operations: list):
+        for operation in operations:
+            if operation.attribute == "buffering" and self.choreo in operation.objects:
+                self.bufferValues[self.steps] = operation.value
+                continue
+            for obj in operation.objects:
+                i = self.targetIndex.get((id(obj), operation.attribute))
+                if i is None:
+                    continue
+                self.operationSteps[i].append(self.steps)
+                self.operations[i].append((operation.adds, operation.value))
+        self.steps += 1
+
+    # Indexes every target once all the steps have been added, and works out which tick
+    # every step runs on
+    def finish(self):
+        self.effects = [None] * len(self.targets)
+        self.changeSteps = [None] * len(self.targets)
+        self.changes = [None] * len(self.targets)
+        for i, operations in enumerate(self.operations):
+            adds = any(adds for adds, _ in operations)
+            if adds and not (
+                isWhole(self.initial[i])
+                and all(isWhole(value) for _, value in operations)
+            ):
+                # Replayed from `operations`, which are kept
+                self.loopStarts[i] = [self.initial[i]]
+                continue
+            self.indexChanges(i)
+        self.findTicks()
+
+    # Replaces the operations on target `i` with the steps its effect changes after
+    def indexChanges(self, i: int):
+        effect = None
+        changeSteps, changes = array("q"), []
+        for step, (adds, value) in zip(self.operationSteps[i], self.operations[i]):
+            effect = composeEffect(effect, adds, value)
+            # Only the effect after the last operation of a step is kept, and setting
+            # something to what it already was doesn't need to be kept
+            if changeSteps and changeSteps[-1] == step:
+                changes[-1] = effect
+            elif not changes or changes[-1] != effect:
+                changeSteps.append(step)
+                changes.append(effect)
+        self.effects[i] = effect
+        self.changeSteps[i] = changeSteps
+        self.changes[i] = changes
+        self.operationSteps[i] = None
+        self.operations[i] = None
+
+    # Works out which tick every step runs on, the same way `Choreography.tick` counts
+    # down `buffering`, a step always runs on the tick `buffering` reaches 0
+    def findTicks(self):
+        if not self.steps:
+            self.applyTicks = np.zeros(0, dtype=np.int64)
+            return
+        ticks = np.zeros(2 * self.steps, dtype=np.int64)
+        after = np.zeros(2 * self.steps, dtype=np.int64)
+        tick, buffering = 0, self.startBuffering
+        for k in range(2 * self.steps):
+            tick += max(buffering, 1)
+            buffering = min(buffering, 0)
+            buffering = self.bufferValues.get(k % self.steps, buffering)
+            ticks[k] = tick
+            after[k] = buffering
+        # Pauses only depend on the step before, so every loop takes as long as the first
+        self.applyTicks = ticks[: self.steps]
+        self.period = int(ticks[self.steps] - ticks[0])
+        self.offsets = self.applyTicks - ticks[0]
+        self.bufferingAfter = after.reshape(2, self.steps)
+
+    # Gets the current value of everything on the timeline
+    def record(self):
+        return [getattr(obj, attribute) for obj, attribute in self.targets]
+
+    # Sets everything on the timeline back to recorded values
+    def restore(self, values: list):
+        for (obj, attribute), value in zip(self.targets, values):
+            setattr(obj, attribute, value)
+
+    # Runs the first `count` operations of a loop on replayed target `i` from `value`
+    def replay(self, i: int, value, count: int):
+        for effect in self.operations[i][:count]:
+            value = applyEffect(value, effect)
+        return value
+
+    # Value of replayed target `i` after `step` of loop `loop`
+    # The value every loop starts with is kept once it's been replayed, so each loop is
+    # only replayed once
+    def replayedValue(self, i: int, loop: int, step: int):
+        starts = self.loopStarts[i]
+        while len(starts) <= loop:
+            starts.append(self.replay(i, starts[-1], len(self.operations[i])))
+        count = bisect_right(self.operationSteps[i], step)
+        return self.replay(i, starts[loop], count)
+
+    # Values after `applied` steps have run, counting every loop
+    # Every loop starts where the last left off, so a target starts loop `loop` after the
+    # whole loop's effect has been applied that many times
+    def valuesAfter(self, applied: int):
+        if applied == 0:
+            return self.initial
+        loop, step = divmod(applied - 1, self.steps)
+        values = []
+        for i, start in enumerate(self.initial):
+            if i in self.loopStarts:
+                values.append(self.replayedValue(i, loop, step))
+                continue
+            loopEffect = self.effects[i]
+            if loop > 0 and loopEffect is not None:
+                start = applyEffect(start, loopEffect, loop)
+            j = bisect_right(self.changeSteps[i], step) - 1
+            values.append(applyEffect(start, self.changes[i][j]) if j >= 0 else start)
+        return values
+
+    # Puts the choreography in the state it would be in after `ticks` calls to `tick`
+    def seek(self, ticks: int):
+        if not len(self.applyTicks) or ticks < self.applyTicks[0]:
+            self.restore(self.initial)
+            self.choreo.stepFrame = 0
+            self.choreo.buffering = self.startBuffering - max(ticks, 0)
+            return
+
+        # Finds the last step to run, loops are all `period` ticks long
+        loop, offset = divmod(ticks - int(self.applyTicks[0]), self.period)
+        i = int(np.searchsorted(self.offsets, offset, side="right")) - 1
+        applied = loop * self.steps + i + 1
+        self.restore(self.valuesAfter(applied))
+
+        self.choreo.stepFrame = applied % self.steps
+        buffering = int(self.bufferingAfter[min(loop, 1)][i])
+        if buffering > 0:
+            buffering -= ticks - (int(self.applyTicks[i]) + loop * self.period)
+        self.choreo.buffering = buffering
@@ -0,0 +1,142 @@
+# tracing.py
+# Lodinu Kalugalage
+#
+# Description: This file contains the tracer, which records how long each part of a frame
+# took as nested spans. Spans can be saved as a Chrome trace (opened in chrome://tracing
+# or ui.perfetto.dev) and as a JSON lines summary with a line for every frame.
+#
+# Tracing is off until `start` is called, until then `span` hands back the same empty
+# context manager every time, so the spans left in the code cost next to nothing.
+
+# Dependencies
+import contextlib  # Included with python
+import json  # Included with python
+import os  # Included with python
+import threading  # Included with python
+import time  # Included with python
+import tracemalloc  # Included with python
+
+
+class Span:
+    tracer: "Tracer"  # Tracer the span is recorded in
+    name: str  # What the span is timing, e.g. "draw.lights"
+    args: dict  # Extra details kept with the span, like the key of the object
+    start: int  # Start time in nanoseconds
+    memoryStart: int  # Traced memory when the span started, when tracing memory
+
+    # Constructor for a `Span`
+    def __init__(self, tracer: "Tracer", name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        if self.tracer.memory:
+            self.memoryStart = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        memory = None
+        if self.tracer.memory:
+            memory = tracemalloc.get_traced_memory()[0] - self.memoryStart
+        self.tracer.record(self, end, memory)
+        return False
+
+
+class Tracer:
+    memory: bool  # Whether spans record how much traced memory they allocated
+    frame = None  # Output frame being made, given to every span that's recorded
+    events: list  # Every finished span, as a Chrome trace "complete" event
+    origin: int  # Time tracing started in nanoseconds, trace times count from it
+    startedTracemalloc: bool  # Whether tracemalloc was started for this tracer
+
+    # Constructor for a `Tracer`
+    # `memory` uses tracemalloc, which makes python noticeably slower while it's on
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.events = []
+        self.origin = time.perf_counter_ns()
+        # Only stopped again by `stop` if it was started here
+        self.startedTracemalloc = memory and not tracemalloc.is_tracing()
+        if self.startedTracemalloc:
+            tracemalloc.start()
+
+    # Keeps a finished span
+    def record(self, span: Span, end: int, memory: int | None):
+        args = dict(span.args)
+        # Spans on other threads can say which frame they're for themselves
+        if self.frame is not None and "frame" not in args:
+            args["frame"] = self.frame
+        if memory is not None:
+            args["memory"] = memory
+        self.events.append(
+            {
+                "name": span.name,
+                "ph": "X",
+                "ts": (span.start - self.origin) / 1000,
+                "dur": (end - span.start) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+    # Saves the spans as Chrome trace event JSON
+    def saveChromeTrace(self, filename: str):
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+    # Saves a JSON line for every frame, with the time (in milliseconds), count and memory
+    # of every kind of span in it, spans about an object are named with its key
+    def saveSummary(self, filename: str):
+        frames = {}
+        for event in self.events:
+            frame = event["args"].get("frame")
+            name = event["name"]
+            if "key" in event["args"]:
+                name += "[" + str(event["args"]["key"]) + "]"
+            spans = frames.setdefault(frame, {})
+            summary = spans.setdefault(name, {"time": 0.0, "count": 0})
+            summary["time"] += event["dur"] / 1000
+            summary["count"] += 1
+            if "memory" in event["args"]:
+                summary["memory"] = summary.get("memory", 0) + event["args"]["memory"]
+        with open(filename, "w") as f:
+            for frame, spans in frames.items():
+                f.write(json.dumps({"frame": frame, "spans": spans}) + "\n")
+
+
+tracer = None  # `Tracer` spans are recorded in, None while tracing is off
+nullSpan = contextlib.nullcontext()  # Handed out by `span` while tracing is off
+
+
+# Starts recording spans, giving back the `Tracer` they go in
+def start(memory=False):
+    global tracer
+    tracer = Tracer(memory)
+    return tracer
+
+
+# Stops recording spans, giving back the `Tracer` they went in
+def stop():
+    global tracer
+    stopped, tracer = tracer, None
+    if stopped is not None and stopped.startedTracemalloc:
+        tracemalloc.stop()
+    return stopped
+
+
+# Sets the output frame that spans from now on belong to
+def setFrame(frame: int):
+    if tracer is not None:
+        tracer.frame = frame
+
+
+# A span timing whatever runs inside it, `args` are kept with it
+#     with tracing.span("smoke.step", key=key):
+def span(name: str, **args):
+    if tracer is None:
+        return nullSpan
+    return Span(tracer, name, args)
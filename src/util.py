@@ -3,10 +3,95 @@
 #
 # Description: This file contains the util functions used throughout the program.
 
+import numpy as np
+
+import contextlib  # Included with python
+import hashlib  # Included with python
+import io  # Included with python
+import os  # Included with python
 import pathlib  # Included with python
+import tempfile  # Included with python
+
+import constants as c
 
 
 # If the program is called from different directories, then the relative path will be different
 # This function gets the absolute path of a file relative to this file
 def getPath(name: str):
     return str((pathlib.Path(__file__).parent / name).absolute())
+
+
+# Splits the command line into positional arguments and `--name` / `--name=value` flags
+# so that options can be given in any order alongside the positional arguments
+def parseArgs(argv: list):
+    args = []
+    flags = {}
+    for arg in argv:
+        if arg.startswith("--"):
+            name, _, value = arg[2:].partition("=")
+            flags[name] = value if value else True
+        else:
+            args.append(arg)
+    return args, flags
+
+
+# Decoded images, so every file is only decoded once however many things use it
+storedImages = {}
+
+
+# Decodes an image file's contents into a numpy array
+def decodeImage(data: bytes):
+    from PIL import Image  # Included with matplotlib
+
+    return np.array(Image.open(io.BytesIO(data)))
+
+
+# Gets a decoded image from the asset cache, decoding and adding it if it isn't there
+# Images are kept as .npy files named by a hash of the file, so an edited image is never
+# mistaken for the old one, and opened memory-mapped and read-only so every process
+# rendering the same assets shares the pages instead of holding its own copy
+def loadCachedImage(data: bytes):
+    cacheDir = getPath(c.ASSET_CACHE_DIR)
+    cacheFile = os.path.join(cacheDir, hashlib.sha256(data).hexdigest() + ".npy")
+    try:
+        return np.load(cacheFile, mmap_mode="r")
+    except (OSError, ValueError):
+        # Not cached yet, or the cached file is damaged and is written again
+        pass
+
+    img = decodeImage(data)
+    tmpName = None
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        # Written under another name and moved into place, so other processes never
+        # open a half written file
+        with tempfile.NamedTemporaryFile(
+            dir=cacheDir, suffix=".tmp", delete=False
+        ) as f:
+            tmpName = f.name
+            np.save(f, img)
+        os.replace(tmpName, cacheFile)
+        return np.load(cacheFile, mmap_mode="r")
+    except OSError as e:
+        print(f"Couldn't cache a decoded image in {cacheDir}: {e}")
+        return img
+    finally:
+        # A half written file is removed rather than left in the cache, once it's been
+        # moved into place there's nothing left to remove
+        if tmpName is not None and os.path.exists(tmpName):
+            with contextlib.suppress(OSError):
+                os.remove(tmpName)
+
+
+# Loads an image as a numpy array, `name` is relative to this file like `getPath`
+# The array is read-only when it comes from the asset cache, so it mustn't be changed
+def loadImage(name: str):
+    path = getPath(name)
+    if path not in storedImages:
+        with open(path, "rb") as f:
+            data = f.read()
+        if c.ASSET_CACHE_DIR is None:
+            storedImages[path] = decodeImage(data)
+        else:
+            storedImages[path] = loadCachedImage(data)
+    return storedImages[path]
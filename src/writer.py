@@ -0,0 +1,142 @@
+# writer.py
+# Lodinu Kalugalage
+#
+# Description: This file contains the FrameWriter class, which encodes and saves frames as
+# PNGs on a pool of threads, so the next frame can be made while the last is written.
+# Frames that look the same as one already written are saved as hard links to it, so
+# still parts of a show aren't encoded or stored again.
+
+# Dependencies
+import concurrent.futures  # Included with python
+import hashlib  # Included with python
+import os  # Included with python
+import shutil  # Included with python
+import threading  # Included with python
+
+import numpy as np
+from PIL import Image  # Included with matplotlib
+
+import constants as c
+import tracing
+
+
+# Encodes an RGBA frame as a PNG and saves it
+# It's written under another name and moved into place, so a frame that was a link to
+# another is replaced rather than written through the link
+def saveImage(rgba: np.ndarray, name: str, frame=None):
+    with tracing.span("write", frame=frame):
+        Image.fromarray(rgba).save(name + ".tmp", format="PNG")
+        os.replace(name + ".tmp", name)
+
+
+# Saves `name` as a hard link to `source` once `written` (the future writing it) is done,
+# or as a copy where links can't be made
+def linkImage(source: str, name: str, written: concurrent.futures.Future, frame=None):
+    written.result()
+    with tracing.span("link", frame=frame):
+        try:
+            if os.path.lexists(name + ".tmp"):
+                os.remove(name + ".tmp")
+            os.link(source, name + ".tmp")
+        except OSError:
+            shutil.copyfile(source, name + ".tmp")
+        os.replace(name + ".tmp", name)
+
+
+class FrameWriter:
+    pool: concurrent.futures.ThreadPoolExecutor  # Threads the frames are written on
+    slots: threading.Semaphore  # Frames that can still be queued before `write` waits
+    pending: set  # Futures of the frames that haven't been written yet
+    error = None  # First error hit writing a frame, raised by the next call
+    dedupe: bool  # Whether frames the same as an earlier one are linked to it
+    written: dict  # (name, future) of the first frame written with each hash of pixels
+    lastWritten = None  # (name, future) of the last frame, for `repeat`
+    lastState = None  # `Choreography.frameState` of the last frame written
+    frames = 0  # Frames queued
+    links = 0  # Frames saved as links to an earlier one
+
+    # Constructor for a `FrameWriter`
+    # At most `queued` frames are held in memory, `write` waits for one to finish after that
+    def __init__(
+        self,
+        workers=c.SNAPSHOT_WORKERS,
+        queued=c.SNAPSHOT_QUEUE,
+        dedupe=c.DEDUPE_FRAMES,
+    ):
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.Semaphore(queued)
+        self.pending = set()
+        self.dedupe = dedupe
+        self.written = {}
+
+    # Runs `function` on the pool, once there's a free slot
+    def submit(self, function, *args):
+        self.raiseError()
+        self.slots.acquire()
+        future = self.pool.submit(function, *args)
+        self.pending.add(future)
+        future.add_done_callback(self.finished)
+        return future
+
+    # Queues a frame to be saved as `name`, the array mustn't be changed after this
+    # `state` is what the frame was drawn from, see `isRepeat`
+    def write(self, rgba: np.ndarray, name: str, frame=None, state=None):
+        self.frames += 1
+        self.lastState = state
+        if not self.dedupe:
+            self.submit(saveImage, rgba, name, frame)
+            return
+
+        # Hashing is much quicker than encoding, so every frame is hashed to find repeats
+        with tracing.span("hash", frame=frame):
+            key = (rgba.shape, hashlib.blake2b(rgba, digest_size=16).digest())
+        if key in self.written:
+            self.lastWritten = self.written[key]
+            self.link(name, frame)
+            return
+        self.lastWritten = (name, self.submit(saveImage, rgba, name, frame))
+        self.written[key] = self.lastWritten
+
+    # Whether a frame drawn from `state` would be the same as the last frame written,
+    # state is None when that can't be known
+    def isRepeat(self, state):
+        return (
+            self.dedupe
+            and self.lastWritten is not None
+            and state is not None
+            and state == self.lastState
+        )
+
+    # Saves `name` as the same frame as the last one, without it being drawn
+    def repeat(self, name: str, frame=None):
+        self.frames += 1
+        self.link(name, frame)
+
+    # Queues `name` to be saved as a link to the last frame written
+    def link(self, name: str, frame=None):
+        self.links += 1
+        source, written = self.lastWritten
+        self.submit(linkImage, source, name, written, frame)
+
+    # Frees up the slot of a written frame, and keeps its error if it had one
+    def finished(self, future: concurrent.futures.Future):
+        self.pending.discard(future)
+        self.slots.release()
+        if future.exception() is not None and self.error is None:
+            self.error = future.exception()
+
+    # Raises the error of a frame that couldn't be written, if there was one
+    def raiseError(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    # Waits until every queued frame has been written
+    def flush(self):
+        concurrent.futures.wait(list(self.pending))
+        self.raiseError()
+
+    # Writes the rest of the frames and stops the threads
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.raiseError()